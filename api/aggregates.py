@@ -0,0 +1,91 @@
+import json
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from .export import flatten
+from .models import ArchivedSurvey, Survey, SurveyAnswerCount
+
+
+def answer_items(answers):
+    """(question, answer) pairs of a survey
+
+    Nested questions are joined with "." (like the CSV export) and answers are
+    stored as text: strings as they are, anything else as JSON.
+    """
+    if not isinstance(answers, dict):
+        return []
+    items = []
+    for key, value in answers.items():
+        for question, answer in flatten(value, key).items():
+            if not isinstance(answer, str):
+                answer = json.dumps(answer)
+            items.append((question[:255], answer[:255]))
+    return items
+
+
+def count_answers(property_id, answers):
+    """Add a survey to the answer counts of its property
+
+    Call it in the transaction that saves the survey. The missing rows are
+    inserted (ignoring the ones inserted concurrently) and then incremented by
+    a single UPDATE, so concurrent surveys never lose a count.
+
+    Args:
+        property_id (int): Property of the survey activity
+        answers (dict): Survey answers
+    """
+    items = answer_items(answers)
+    if property_id is None or not items:
+        return
+    SurveyAnswerCount.objects.bulk_create(
+        [
+            SurveyAnswerCount(property_id=property_id, question=question, answer=answer)
+            for question, answer in items
+        ],
+        ignore_conflicts=True,
+    )
+    condition = Q()
+    for question, answer in items:
+        condition |= Q(question=question, answer=answer)
+    SurveyAnswerCount.objects.filter(condition, property_id=property_id).update(
+        count=F("count") + 1
+    )
+
+
+def rebuild_answer_counts(batch_size=5000):
+    """Recompute every answer count from the surveys (archived ones included)
+
+    Runs in one transaction. On Postgres the counts table is locked first, so
+    surveys created meanwhile wait and are counted on top of the rebuild.
+
+    Returns:
+        int: Number of (property, question, answer) rows
+    """
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"LOCK TABLE {SurveyAnswerCount._meta.db_table} "
+                    "IN SHARE ROW EXCLUSIVE MODE"
+                )
+        SurveyAnswerCount.objects.all().delete()
+        counts = Counter()
+        for model in (Survey, ArchivedSurvey):
+            surveys = model.objects.filter(
+                activity__property__isnull=False
+            ).values_list("activity__property_id", "answers")
+            for property_id, answers in surveys.iterator(chunk_size=batch_size):
+                for question, answer in answer_items(answers):
+                    counts[property_id, question, answer] += 1
+        SurveyAnswerCount.objects.bulk_create(
+            (
+                SurveyAnswerCount(
+                    property_id=property_id, question=question, answer=answer, count=n
+                )
+                for (property_id, question, answer), n in counts.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(counts)
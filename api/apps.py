@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from .cache import invalidate_on_write
+        from .identity import forget_on_delete, remember_on_save
+        from .middleware import instrument_connection
+        from .models import Activity, Property, Survey
+
+        for model in (Property, Activity, Survey):
+            post_save.connect(invalidate_on_write, sender=model)
+            post_delete.connect(invalidate_on_write, sender=model)
+            post_save.connect(remember_on_save, sender=model)
+            post_delete.connect(forget_on_delete, sender=model)
+        connection_created.connect(instrument_connection)
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .middleware import timing
+from .views import ActivityViewSet, PropertyViewSet, SurveyViewSet
+
+_executors = {}
+
+
+def get_executor():
+    """Thread pool shared by the async views, sized by API_ASYNC_WORKERS
+
+    The size bounds the queries in flight (and the connections open) per
+    process, however many requests the event loop is holding.
+    """
+    workers = getattr(settings, "API_ASYNC_WORKERS", 8)
+    if workers not in _executors:
+        _executors[workers] = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="api-async"
+        )
+    return _executors[workers]
+
+
+async def run_in_pool(fn, *args, **kwargs):
+    """Run a blocking function in the pool without holding the event loop
+
+    Connections are checked like at the start and end of a sync request.
+    """
+
+    def call():
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return await sync_to_async(call, thread_sensitive=False, executor=get_executor())()
+
+
+def render_view(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, "render"):
+        with timing("render"):
+            response.render()
+    return response
+
+
+def async_view(viewset, actions):
+    """Async version of a viewset action
+
+    The queries, the serialization and the rendering run in the pool, so the
+    event loop only waits for the result.
+
+    Args:
+        viewset (ViewSet): View class
+        actions (dict): Method to action (e.g. {"get": "list"})
+
+    Returns:
+        function: Async view
+    """
+    view = viewset.as_view(actions)
+
+    async def wrapper(request, *args, **kwargs):
+        return await run_in_pool(render_view, view, request, *args, **kwargs)
+
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+property_list = async_view(PropertyViewSet, {"get": "list"})
+property_detail = async_view(PropertyViewSet, {"get": "retrieve"})
+activity_list = async_view(ActivityViewSet, {"get": "list"})
+activity_detail = async_view(ActivityViewSet, {"get": "retrieve"})
+survey_detail = async_view(SurveyViewSet, {"get": "retrieve"})
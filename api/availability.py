@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from .models import Activity
+
+HOUR = timedelta(hours=1)
+MINUTE = timedelta(minutes=1)  # Resolution of the schedules (%Y-%m-%dT%H:%M)
+
+
+def merge(intervals):
+    """Merge sorted closed intervals that overlap or touch"""
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def availability(property_id, start, end, duration=HOUR):
+    """Busy and free intervals of a property between start and end
+
+    Loads the schedules of the active activities around the range with one
+    query (activity_schedule_idx) and sweeps them in order. Activities last up
+    to an hour: an existing activity at ``e`` occupies [e, e + 1h], and a new
+    activity of ``duration`` may not start in [e - max(duration, 1h), e + 1h],
+    the same rule ActivitySerializer.validate applies (bounds included).
+
+    Args:
+        property_id (int): Property
+        start (datetime): Beginning of the range (aware)
+        end (datetime): End of the range (aware)
+        duration (timedelta, optional): Duration of the activity to place
+
+    Returns:
+        tuple: (busy, free) lists of [start, end] pairs. busy are the merged
+            occupied intervals; free are the ranges of valid schedules
+            (any minute within a range, bounds included, passes validation).
+    """
+    before = max(duration, HOUR)
+    schedules = (
+        Activity.objects.scheduled_between(property_id, start - HOUR, end + before)
+        .order_by("schedule")
+        .values_list("schedule", flat=True)
+    )
+    busy, blocked = [], []
+    for schedule in schedules:
+        busy.append((schedule, schedule + HOUR))
+        blocked.append((schedule - before, schedule + HOUR))
+
+    free = []
+    cursor = start  # First schedule not blocked yet
+    for blocked_start, blocked_end in merge(blocked):
+        if blocked_start > cursor:
+            free.append([cursor, min(blocked_start - MINUTE, end)])
+        cursor = max(cursor, blocked_end + MINUTE)
+        if cursor > end:
+            break
+    if cursor <= end:
+        free.append([cursor, end])
+    busy = [
+        [max(s, start), min(e, end)] for s, e in merge(busy) if e >= start and s <= end
+    ]
+    return busy, [interval for interval in free if interval[0] <= interval[1]]
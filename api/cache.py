@@ -0,0 +1,154 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.timezone import now
+from rest_framework.response import Response
+
+from .conditional import not_modified, parse_validators
+from .dbrouters import reading_replica
+
+HITS = "api:stats:hits"
+MISSES = "api:stats:misses"
+
+
+def get_cache():
+    return caches[getattr(settings, "API_CACHE_ALIAS", "default")]
+
+
+def generation(model):
+    """Current generation counter of a model (bumped by every write)
+
+    A missing counter (first use, eviction or restart of the cache) starts from
+    the current time, so it can never go back to a value used by old entries.
+    """
+    cache = get_cache()
+    key = f"api:gen:{model._meta.label_lower}"
+    if (value := cache.get(key)) is None:
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump(*models):
+    cache = get_cache()
+    for model in models:
+        key = f"api:gen:{model._meta.label_lower}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def invalidate(*models):
+    """Invalidate the cached responses built from the given models
+
+    The counters are bumped right away and again on commit, so a response
+    cached by another request before the transaction was committed (and built
+    from the old rows) is not served afterwards.
+    """
+    bump(*models)
+    transaction.on_commit(lambda: bump(*models))
+
+
+def invalidate_on_write(sender, **kwargs):
+    """post_save / post_delete receiver"""
+    invalidate(sender)
+
+
+def response_key(view, request, models, kwargs):
+    params = sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists()
+    )
+    identity = repr((request.get_host(), params, sorted(kwargs.items())))
+    generations = ".".join(str(generation(model)) for model in models)
+    digest = hashlib.md5(identity.encode()).hexdigest()
+    return f"api:resp:{view}:{generations}:{digest}"
+
+
+def stats():
+    """Hit/miss counters of the response cache
+
+    Returns:
+        dict: {"hits", "misses", "ratio"}
+    """
+    cache = get_cache()
+    hits, misses = cache.get(HITS, 0), cache.get(MISSES, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "ratio": hits / total if total else 0.0}
+
+
+def count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def cached_response(timeout_setting="API_CACHE_TIMEOUT"):
+    """Decorator for caching the data of successful GET responses of a viewset
+
+    The key is built from the normalized query params, the url kwargs and the
+    generation counters of the models listed in the ``cache_models`` attribute
+    of the view, so any write to those models makes the entry unreachable.
+
+    Cached responses keep their ETag / Last-Modified, so conditional requests
+    are answered from the cache too. Responses that change with time without a
+    write set ``valid_until`` (see conditional.due_changes): their entry
+    expires then, and it is not stored at all when that time has passed.
+
+    Responses read from a replica are served but not stored: a lagging replica
+    could otherwise fill the current generation with data older than the
+    write that bumped it.
+
+    Args:
+        timeout_setting (str, optional): Setting with the seconds entries live
+
+    Returns:
+        Response: Cached response (X-Cache: HIT) or the view response (MISS)
+    """
+
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(view, request, *args, **kwargs):
+            if not getattr(settings, "API_CACHE_ENABLED", False):
+                return fn(view, request, *args, **kwargs)
+            cache = get_cache()
+            key = response_key(
+                f"{type(view).__name__}.{fn.__name__}",
+                request,
+                view.cache_models,
+                kwargs,
+            )
+            if (cached := cache.get(key)) is not None:
+                count(HITS)
+                data, headers = cached
+                validators = parse_validators(headers)
+                if (response := not_modified(request, *validators)) is None:
+                    response = Response(data, headers=headers)
+                response["X-Cache"] = "HIT"
+                return response
+            count(MISSES)
+            response = fn(view, request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                headers = {
+                    header: response[header]
+                    for header in ("ETag", "Last-Modified")
+                    if header in response
+                }
+                timeout = getattr(settings, timeout_setting, 300)
+                if valid_until := getattr(response, "valid_until", None):
+                    seconds = int((valid_until - now()).total_seconds())
+                    timeout = seconds if timeout is None else min(timeout, seconds)
+                if (timeout is None or timeout > 0) and not reading_replica():
+                    cache.set(key, (response.data, headers), timeout)
+                response["X-Cache"] = "MISS"
+            return response
+
+        return decorator
+
+    return wrapper
@@ -0,0 +1,186 @@
+import hashlib
+
+from django.db.models import Count, Max, Min, Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.timezone import now
+from rest_framework.response import Response
+
+# Validators cover the writes (the updated field). Rows whose representation
+# also changes with time (models.condition_due) are described by a ``due``
+# tuple (timestamp field, lookups): the last due timestamp already passed
+# counts as a change, and the next one is returned so responses are not
+# cached past it.
+
+
+def timestamp(value):
+    return int(value.timestamp() * 1_000_000) if value else 0
+
+
+def latest(*values):
+    return max((value for value in values if value), default=None)
+
+
+def field_value(row, name):
+    return row.get(name) if isinstance(row, dict) else getattr(row, name, None)
+
+
+def due_changes(rows, due, moment=None):
+    """Changes of rows that happen with time, without a write
+
+    Args:
+        rows (iterable): Model instances or values() dicts
+        due (tuple): (timestamp field, lookups of the rows) or None
+        moment (datetime, optional): Now by default
+
+    Returns:
+        tuple: (last due timestamp passed, next due timestamp), None each when
+            there is none
+    """
+    if due is None:
+        return None, None
+    moment = moment or now()
+    field, lookups = due
+    passed, upcoming = None, None
+    for row in rows:
+        if any(field_value(row, key) != value for key, value in lookups.items()):
+            continue
+        if (when := field_value(row, field)) is None:
+            continue
+        if when < moment:
+            passed = latest(passed, when)
+        elif upcoming is None or when < upcoming:
+            upcoming = when
+    return passed, upcoming
+
+
+def object_validators(instance, field, due=None):
+    """ETag and Last-Modified of a single object
+
+    Args:
+        instance (Model): Object being retrieved
+        field (str): Timestamp updated on every change (e.g. "updated_at")
+        due (tuple, optional): Changes with time (see due_changes)
+
+    Returns:
+        tuple: (etag, last modified timestamp in seconds)
+    """
+    passed, _ = due_changes([instance], due)
+    updated = latest(getattr(instance, field), passed)
+    etag = f'"{instance._meta.model_name}-{instance.pk}-{timestamp(updated)}"'
+    return etag, int(updated.timestamp()) if updated else None
+
+
+def list_validators(request, queryset, field, due=None):
+    """ETag and Last-Modified of a filtered list, with one aggregate query
+
+    The ETag covers the newest timestamp, the number of rows (deletions) and the
+    query params (filters and page). With ``due`` the newest due timestamp
+    already passed counts as a change too.
+
+    Returns:
+        tuple: ((etag, last modified timestamp in seconds), number of rows,
+            next due timestamp or None)
+    """
+    aggregates = dict(last=Max(field), rows=Count("pk"))
+    if due is not None:
+        moment = now()
+        due_field, lookups = due
+        aggregates["passed"] = Max(
+            due_field, filter=Q(**lookups, **{f"{due_field}__lt": moment})
+        )
+        aggregates["upcoming"] = Min(
+            due_field, filter=Q(**lookups, **{f"{due_field}__gte": moment})
+        )
+    result = queryset.order_by().aggregate(**aggregates)
+    last = latest(result["last"], result.get("passed"))
+    identity = repr(
+        (
+            queryset.model._meta.label_lower,
+            sorted(request.query_params.lists()),
+            timestamp(last),
+            result["rows"],
+        )
+    )
+    etag = f'"{hashlib.md5(identity.encode()).hexdigest()}"'
+    last_modified = int(last.timestamp()) if last else None
+    return (etag, last_modified), result["rows"], result.get("upcoming")
+
+
+def page_validators(request, rows, field, due=None):
+    """ETag and Last-Modified of a page already fetched (keyset pagination)
+
+    Computed from the rows themselves so a page stays O(page_size).
+
+    Args:
+        rows (list): Model instances or values() dicts
+        due (tuple, optional): Changes with time (see due_changes)
+
+    Returns:
+        tuple: (etag, last modified timestamp in seconds)
+    """
+    keys = [
+        (
+            field_value(row, "id"),
+            latest(field_value(row, field), due_changes([row], due)[0]),
+        )
+        for row in rows
+    ]
+    last = max((updated for _, updated in keys if updated), default=None)
+    identity = repr(
+        (
+            sorted(request.query_params.lists()),
+            [(pk, timestamp(updated)) for pk, updated in keys],
+        )
+    )
+    etag = f'"{hashlib.md5(identity.encode()).hexdigest()}"'
+    return etag, int(last.timestamp()) if last else None
+
+
+def combine_validators(*validators):
+    """ETag and Last-Modified of a response built from several lists
+
+    Args:
+        validators: (etag, last modified) of each list
+
+    Returns:
+        tuple: (etag, last modified timestamp in seconds)
+    """
+    if len(validators) == 1:
+        return validators[0]
+    identity = "".join(etag for etag, _ in validators)
+    last = max((modified for _, modified in validators if modified), default=None)
+    return f'"{hashlib.md5(identity.encode()).hexdigest()}"', last
+
+
+def validator_headers(etag, last_modified):
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def parse_validators(headers):
+    """Inverse of validator_headers (for cached responses)"""
+    last_modified = headers.get("Last-Modified")
+    return headers.get("ETag"), last_modified and parse_http_date_safe(last_modified)
+
+
+def not_modified(request, etag, last_modified):
+    """Evaluate If-None-Match / If-Modified-Since (and If-Match preconditions)
+
+    Returns:
+        Response: 304 (or 412) response, None when the full response is needed
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return Response(
+        status=response.status_code, headers=validator_headers(etag, last_modified)
+    )
+
+
+def add_validators(response, etag, last_modified):
+    for header, value in validator_headers(etag, last_modified).items():
+        response[header] = value
+    return response
@@ -0,0 +1,70 @@
+from functools import partial
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as BaseCreation
+
+from api.pool import close_pools, get_pool
+
+
+def ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+class DatabaseCreation(BaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools(database=test_database_name)  # Idle connections block DROP
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend with an in-process connection pool and health checks
+
+    Extra keys of the database settings (db.json):
+        POOL (dict, optional): SIZE, MAX_OVERFLOW, TIMEOUT and RECYCLE of the
+            pool (see api.pool.ConnectionPool). Closing the connection (end of
+            request with CONN_MAX_AGE 0) returns it to the pool.
+        CONN_HEALTH_CHECKS (bool, optional): Check a persistent connection
+            (CONN_MAX_AGE) before each request, and a pooled one on checkout.
+    """
+
+    creation_class = DatabaseCreation
+
+    @property
+    def pool_options(self):
+        return self.settings_dict.get("POOL")
+
+    def get_new_connection(self, conn_params):
+        if self.pool_options is None:
+            return super().get_new_connection(conn_params)
+        options = dict(
+            self.pool_options,
+            check=ping if self.settings_dict.get("CONN_HEALTH_CHECKS") else None,
+            reset=lambda connection: connection.rollback(),
+        )
+        self.pool = get_pool(
+            f"{self.alias}/{conn_params.get('database')}",
+            partial(super().get_new_connection, conn_params),
+            options,
+        )
+        connection = self.pool.acquire()
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.pool_options is None or self.connection is None:
+            return super()._close()
+        discard = bool(self.connection.closed) or (
+            self.errors_occurred and not self.is_usable()
+        )
+        with self.wrap_database_errors:
+            self.pool.release(self.connection, discard=discard)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        if self.connection is None or self.in_atomic_block:
+            return
+        if self.settings_dict.get("CONN_HEALTH_CHECKS") and not self.is_usable():
+            self.close()
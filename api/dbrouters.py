@@ -0,0 +1,98 @@
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PIN_COOKIE = "api_primary_until"
+
+_use_replica = ContextVar("api_use_replica", default=False)
+
+
+def replicas():
+    return getattr(settings, "API_REPLICAS", [])
+
+
+def reading_replica():
+    """Whether the reads of the current request go to a replica"""
+    return _use_replica.get() and bool(replicas())
+
+
+class ReplicaRouter:
+    """Send the reads of GET requests to the replicas (API_REPLICAS)
+
+    Every other read (writes, transactions of POST/PATCH/DELETE, management
+    commands) and every write go to the primary ("default"). Reads of a
+    client that wrote less than API_PIN_SECONDS ago stay on the primary too,
+    see ReplicaPinMiddleware.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and (aliases := replicas()):
+            return random.choice(aliases)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in replicas() else None
+
+
+class ReplicaPinMiddleware:
+    """Decide whether the request may read from a replica (read-your-writes)
+
+    GET/HEAD/OPTIONS requests read from the replicas unless the client wrote
+    recently: any other request sets a cookie that keeps the reads of that
+    client on the primary for API_PIN_SECONDS.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Same marker as MiddlewareMixin: the handler awaits this middleware
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = _use_replica.set(self.reads_from_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = _use_replica.set(self.reads_from_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        return self.pin(request, response)
+
+    def reads_from_replica(self, request):
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            return False
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) < time.time()
+        except ValueError:
+            return True
+
+    def pin(self, request, response):
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            seconds = getattr(settings, "API_PIN_SECONDS", 10)
+            response.set_cookie(
+                PIN_COOKIE, f"{time.time() + seconds:.3f}", max_age=seconds
+            )
+        return response
@@ -0,0 +1,49 @@
+from rest_framework import serializers
+
+from .responses import ErrorMsg, InfoMsg
+
+FIELDS_PARAM = "fields"
+EXPAND_PARAM = "expand"
+
+
+def split_names(value):
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def sparse_fieldset(params, serializer_class):
+    """Fields (?fields=id,title) and relations (?expand=property) asked by the client
+
+    Relations are nested by default. With ?fields= they are ids unless they
+    are listed in ?expand=.
+
+    Args:
+        params (QueryDict): Query params
+        serializer_class (Serializer): Serializer of the view (Meta.fields and
+            expandable)
+
+    Raises:
+        ValidationError: Unknown field or relation
+
+    Returns:
+        dict: Serializer context entries: fields (tuple in Meta.fields order, or
+            None for every field) and expand (tuple)
+    """
+    available = serializer_class.Meta.fields
+    expandable = getattr(serializer_class, "expandable", ())
+    fields = split_names(params.get(FIELDS_PARAM, ""))
+    expand = split_names(params.get(EXPAND_PARAM, ""))
+    for param, names, valid in (
+        (FIELDS_PARAM, fields, available),
+        (EXPAND_PARAM, expand, expandable),
+    ):
+        if names - set(valid):
+            raise serializers.ValidationError(
+                {
+                    "error": ErrorMsg.INVALID_VALUE.format(param),
+                    "info": InfoMsg.AVAILABLE_VALUES.format(", ".join(valid)),
+                }
+            )
+    return {
+        "fields": tuple(name for name in available if name in fields) or None,
+        "expand": tuple(name for name in expandable if name in expand),
+    }
@@ -0,0 +1,279 @@
+import json
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from django.utils.timezone import datetime
+from django.utils.timezone import now
+from django.utils.timezone import timedelta
+from rest_framework import serializers
+
+from .models import computed_condition, live_condition
+from .responses import ErrorMsg
+
+ACTIVITY_FILTERS = ("status", "condition", "schedule_from", "schedule_to")
+ANSWERS_PREFIX = "answers."
+
+
+def parse_schedule(value):
+    """Parse a schedule received in the query string (%Y-%m-%dT%H:%M)
+
+    Raises:
+        ValidationError: DateTime format error
+    """
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M")
+    except (TypeError, ValueError):
+        raise serializers.ValidationError({"error": "DateTime format error"})
+
+
+def include_archived(params):
+    """Whether the archive tables are read too (?include_archived=1)"""
+    return str(params.get("include_archived", "")).lower() in {"1", "true"}
+
+
+def condition_filtered(params):
+    """Whether ?condition= selects rows that change with time (computed mode)"""
+    condition = params.get("condition")
+    return computed_condition() and bool(condition) and condition != "all"
+
+
+def filter_activities(params, queryset, prefix="", default_window=True):
+    """Apply the activity list filters
+
+    Without any filter the activities from one week before to one week later are
+    returned. status and condition accept "all".
+
+    Args:
+        params (QueryDict): Query params (status, condition, schedule_from, schedule_to)
+        queryset (QuerySet): Activities, or a model related to them
+        prefix (str, optional): Lookup path to the activity (e.g. "activity__")
+        default_window (bool, optional): Apply the weekly window without filters
+
+    Returns:
+        QuerySet: Filtered queryset
+    """
+    if default_window and not any(params.get(name) for name in ACTIVITY_FILTERS):
+        queryset = queryset.filter(
+            **{
+                f"{prefix}schedule__range": (
+                    now() - timedelta(days=7),
+                    now() + timedelta(days=7),
+                )
+            }
+        )
+    if (status := params.get("status")) and status != "all":
+        queryset = queryset.filter(**{f"{prefix}status": status})
+
+    if (condition := params.get("condition")) and condition != "all":
+        if computed_condition():
+            queryset = queryset.annotate(live_condition=live_condition(prefix)).filter(
+                live_condition=condition
+            )
+        else:
+            queryset = queryset.filter(**{f"{prefix}condition": condition})
+
+    if schedule_from := params.get("schedule_from"):
+        queryset = queryset.filter(
+            **{f"{prefix}schedule__gt": parse_schedule(schedule_from)}
+        )
+
+    if schedule_to := params.get("schedule_to"):
+        queryset = queryset.filter(
+            **{f"{prefix}schedule__lt": parse_schedule(schedule_to)}
+        )
+    return queryset
+
+
+SEARCH_CONFIG = "english"
+SEARCH_FIELDS = ("title", "address", "description")
+# Same title/address/description weights as the Postgres trigger (A, B, C)
+FTS_RANK = """
+SELECT -bm25(api_property_fts, 10.0, 5.0, 1.0) FROM api_property_fts
+WHERE api_property_fts MATCH %s AND rowid = api_property.id
+"""
+FTS_MATCH = "SELECT rowid FROM api_property_fts WHERE api_property_fts MATCH %s"
+
+
+def search_properties(queryset, text):
+    """Properties matching every word of ``text`` in title, address or description
+
+    Postgres matches the search_vector (GIN index) and ranks with ts_rank,
+    SQLite uses its FTS5 index and bm25. Other backends fall back to
+    icontains (rank 0).
+
+    Args:
+        queryset (QuerySet): Properties
+        text (str): Words to search
+
+    Returns:
+        QuerySet: Matching properties annotated with ``rank`` (higher is better)
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        query = SearchQuery(text, config=SEARCH_CONFIG)
+        # double precision: the rank is part of the pagination cursor
+        rank = Cast(SearchRank(F("search_vector"), query), FloatField())
+        return queryset.filter(search_vector=query).annotate(rank=rank)
+    if vendor == "sqlite":
+        match = " ".join(
+            '"{}"'.format(word.replace('"', '""')) for word in text.split()
+        )
+        return queryset.filter(pk__in=RawSQL(FTS_MATCH, (match,))).annotate(
+            rank=RawSQL(FTS_RANK, (match,), output_field=FloatField())
+        )
+    condition = Q()
+    for word in text.split():
+        condition &= Q(
+            *((f"{field}__icontains", word) for field in SEARCH_FIELDS),
+            _connector=Q.OR,
+        )
+    return queryset.filter(condition).annotate(rank=Value(0.0, FloatField()))
+
+
+FTS_ADDRESS = (
+    "SELECT rowid FROM api_property_address WHERE api_property_address MATCH %s"
+)
+
+
+def address_contains(queryset, text):
+    """Q for the properties whose address contains ``text`` (case insensitive)
+
+    Served by the trigram indexes of migration 0007 for 3+ characters: GIN
+    (pg_trgm) on Postgres, FTS5 trigram table on SQLite 3.34+.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == "sqlite":
+        if connection.Database.sqlite_version_info >= (3, 34):  # FTS5 trigram
+            phrase = '"{}"'.format(text.replace('"', '""'))
+            return Q(pk__in=RawSQL(FTS_ADDRESS, (phrase,)))
+    return Q(address__icontains=text)
+
+
+def autocomplete_properties(queryset, text, limit):
+    """Properties for an address type-ahead, addresses starting with ``text`` first
+
+    At most two LIMIT queries without sorting (the matches of a short text can
+    be many): the addresses starting with the text (only on Postgres, where the
+    trigram index serves it) and then the ones containing it.
+
+    Args:
+        queryset (QuerySet): Properties
+        text (str): Text typed (3 characters or more)
+        limit (int): Maximum number of results
+
+    Returns:
+        list: {"id", "title", "address"} dicts
+    """
+    columns = ("id", "title", "address")
+    rows = []
+    if connections[queryset.db].vendor == "postgresql":
+        rows = list(queryset.filter(address__istartswith=text).values(*columns)[:limit])
+    if len(rows) < limit:
+        rows += (
+            queryset.filter(address_contains(queryset, text))
+            .exclude(pk__in=[row["id"] for row in rows])
+            .values(*columns)[: limit - len(rows)]
+        )
+    text = text.casefold()
+    return sorted(
+        rows,
+        key=lambda row: (
+            not row["address"].casefold().startswith(text),
+            row["address"],
+            row["id"],
+        ),
+    )
+
+
+def json_contains(queryset, field, value):
+    """Q for a JSON column containing ``value``
+
+    jsonb @> (served by the GIN index of the answers) when the backend supports
+    it, otherwise an equivalent AND of key lookups.
+
+    Args:
+        queryset (QuerySet): Queryset being filtered (its database decides)
+        field (str): Lookup path of the JSON column (or of a key of it)
+        value: JSON object, or scalar compared with the key
+
+    Returns:
+        Q: The condition
+    """
+    if connections[queryset.db].features.supports_json_field_contains:
+        return Q(**{f"{field}__contains": value})
+    if isinstance(value, dict):
+        condition = Q()
+        for key, item in value.items():
+            condition &= json_contains(queryset, f"{field}__{key}", item)
+        return condition
+    return Q(**{field: value})
+
+
+def answer_values(value):
+    """Values an answer received in the query string can match
+
+    "5" matches the number 5 and the text "5", "poor" only the text.
+    """
+    try:
+        decoded = json.loads(value)
+    except ValueError:
+        return [value]
+    if isinstance(decoded, (str, dict, list)):
+        return [value]
+    return [decoded, value]
+
+
+def filter_surveys(params, queryset):
+    """Apply the survey filters
+
+    Args:
+        params (QueryDict): Query params:
+            answers.<key>[.<subkey>]=<value>: Answer equal to the value
+            answers_contains=<JSON object>: Answers containing the object
+            property=<id>: Property of the activity
+            status, condition, schedule_from, schedule_to: Activity filters
+                (without the weekly window)
+        queryset (QuerySet): Surveys
+
+    Raises:
+        ValidationError: Invalid property or answers_contains
+
+    Returns:
+        QuerySet: Filtered queryset
+    """
+    queryset = filter_activities(
+        params, queryset, prefix="activity__", default_window=False
+    )
+    if property_ := params.get("property"):
+        if not property_.isdigit():
+            raise serializers.ValidationError(
+                {"error": ErrorMsg.INVALID_VALUE.format("property")}
+            )
+        queryset = queryset.filter(activity__property_id=int(property_))
+
+    for name in sorted(params):
+        if not name.startswith(ANSWERS_PREFIX) or not name.split(".")[1]:
+            continue
+        path = name.split(".")[1:]
+        for value in params.getlist(name):
+            condition = Q()
+            for candidate in answer_values(value):
+                for key in reversed(path):
+                    candidate = {key: candidate}
+                condition |= json_contains(queryset, "answers", candidate)
+            queryset = queryset.filter(condition)
+
+    if contains := params.get("answers_contains"):
+        try:
+            value = json.loads(contains)
+        except ValueError:
+            value = None
+        if not isinstance(value, dict):
+            raise serializers.ValidationError(
+                {"error": ErrorMsg.INVALID_VALUE.format("answers_contains")}
+            )
+        queryset = queryset.filter(json_contains(queryset, "answers", value))
+    return queryset
@@ -0,0 +1,137 @@
+import asyncio
+from contextvars import ContextVar
+
+_identity_map = ContextVar("api_identity_map", default=None)
+
+
+def _key(model, field, value):
+    return model._meta.label_lower, field, str(value)
+
+
+class IdentityMap:
+    """Objects loaded during a request, by model and unique field
+
+    Misses are remembered too (None), so "has no survey" is only asked once.
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def get(self, model, queryset=None, **lookup):
+        """Object with the unique lookup (e.g. pk=1, activity_id=1) or None
+
+        Args:
+            model (Model): Model class
+            queryset (QuerySet, optional): Used for the first load (e.g. with
+                select_related); related objects it loads are remembered too
+            lookup: A single unique field (attname) and its value
+        """
+        ((field, value),) = lookup.items()
+        field = "pk" if field == model._meta.pk.attname else field
+        key = _key(model, field, value)
+        if key not in self.objects:
+            queryset = model._default_manager.all() if queryset is None else queryset
+            instance = queryset.filter(**{field: value}).first()
+            if instance is None:
+                self.objects[key] = None
+            else:
+                self.add(instance)
+                self.objects.setdefault(key, instance)
+        return self.objects[key]
+
+    def add(self, instance, created=False):
+        """Remember an instance under its unique fields, with its cached relations
+
+        Args:
+            instance (Model): Loaded or saved instance
+            created (bool, optional): Just inserted, so nothing points to it yet
+        """
+        opts = instance._meta
+        self.objects[_key(type(instance), "pk", instance.pk)] = instance
+        for field in opts.concrete_fields:
+            if field.unique and not field.primary_key:
+                value = getattr(instance, field.attname)
+                self.objects[_key(type(instance), field.attname, value)] = instance
+        for field in opts.related_objects:
+            # Reverse one-to-one (e.g. Activity.survey): loaded by select_related,
+            # or known to be missing on a new row
+            if not field.one_to_one:
+                continue
+            name = field.get_cache_name()
+            if name in instance._state.fields_cache or created:
+                related = instance._state.fields_cache.get(name)
+                key = _key(field.related_model, field.field.attname, instance.pk)
+                self.objects[key] = related
+                if related is not None:
+                    self.add(related)
+        for field in opts.concrete_fields:
+            # Forward relations loaded with the instance (e.g. Activity.property)
+            if not field.is_relation:
+                continue
+            related = instance._state.fields_cache.get(field.get_cache_name())
+            if related is not None:
+                self.objects.setdefault(_key(type(related), "pk", related.pk), related)
+
+    def discard(self, instance):
+        """Forget a deleted instance: later lookups find nothing"""
+        for key, value in self.objects.items():
+            if value is instance:
+                self.objects[key] = None
+        self.objects[_key(type(instance), "pk", instance.pk)] = None
+
+
+def get_object(model, queryset=None, **lookup):
+    """Load an object once per request (a plain query outside of requests)
+
+    See IdentityMap.get.
+    """
+    if (identity_map := _identity_map.get()) is None:
+        ((field, value),) = lookup.items()
+        queryset = model._default_manager.all() if queryset is None else queryset
+        return queryset.filter(**{field: value}).first()
+    return identity_map.get(model, queryset, **lookup)
+
+
+def remember(instance, created=False):
+    if (identity_map := _identity_map.get()) is not None:
+        identity_map.add(instance, created)
+
+
+def remember_on_save(sender, instance, created=False, **kwargs):
+    """post_save receiver: later reads of the request see the saved row"""
+    remember(instance, created)
+
+
+def forget_on_delete(sender, instance, **kwargs):
+    """post_delete receiver"""
+    if (identity_map := _identity_map.get()) is not None:
+        identity_map.discard(instance)
+
+
+class IdentityMapMiddleware:
+    """Give each request its own IdentityMap, dropped when the request ends"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Same marker as MiddlewareMixin: the handler awaits this middleware
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = _identity_map.set(IdentityMap())
+        try:
+            return self.get_response(request)
+        finally:
+            _identity_map.reset(token)
+
+    async def __acall__(self, request):
+        token = _identity_map.set(IdentityMap())
+        try:
+            return await self.get_response(request)
+        finally:
+            _identity_map.reset(token)
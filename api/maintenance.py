@@ -0,0 +1,140 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils.timezone import now, timedelta
+
+from .cache import invalidate
+from .models import Activity, ArchivedActivity, ArchivedSurvey, Survey
+
+ACTIVITY_COLUMNS = (
+    "id",
+    "property_id",
+    "schedule",
+    "title",
+    "created_at",
+    "updated_at",
+    "status",
+    "condition",
+)
+SURVEY_COLUMNS = ("id", "activity_id", "answers", "created_at")
+
+
+def mark_overdue(batch_size=1000, log=None):
+    """Move the past-due Pending activities to Overdue
+
+    Each batch is a single set-based UPDATE (committed on its own), so the job
+    never holds long locks and can run periodically (cron, celery beat...).
+
+    Args:
+        batch_size (int, optional): Activities updated per UPDATE
+        log (callable, optional): Receives a progress line per batch
+
+    Returns:
+        int: Number of activities moved to Overdue
+    """
+    total = 0
+    started = perf_counter()
+    while True:
+        batch_started = perf_counter()
+        ids = list(Activity.objects.overdue().values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            break
+        updated = (
+            Activity.objects.overdue()
+            .filter(pk__in=ids)
+            .update(condition="Overdue", updated_at=now())
+        )
+        total += updated
+        if log:
+            log(
+                f"{updated} activities marked as Overdue ({total} total) "
+                f"in {(perf_counter() - batch_started) * 1000:.1f}ms"
+            )
+    if total:
+        invalidate(Activity)  # update() sends no post_save
+    if log:
+        log(f"Done: {total} activities in {(perf_counter() - started) * 1000:.1f}ms")
+    return total
+
+
+def delete_rows(model, field, values):
+    """Plain DELETE ... WHERE field IN (values)
+
+    No per-row collector queries and no post_delete signals (the cache is
+    invalidated once per run instead of once per row).
+
+    Returns:
+        int: Deleted rows
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} "
+            f"WHERE {quote(model._meta.get_field(field).column)} IN ({placeholders})",
+            list(values),
+        )
+        return cursor.rowcount
+
+
+def archive(retention_days=None, batch_size=500, log=None):
+    """Move old cancelled and done activities, with their surveys, to the archive
+
+    Each batch copies the rows to ArchivedActivity/ArchivedSurvey and deletes
+    them with one DELETE per table, in its own short transaction. On Postgres
+    the rows are locked with SKIP LOCKED, so concurrent writers never wait for
+    the job. Survey answer counts are left as they are: archived surveys are
+    still counted (see rebuild_answer_counts).
+
+    Args:
+        retention_days (int, optional): Activities scheduled in the last days
+            are kept, API_ARCHIVE_RETENTION_DAYS by default
+        batch_size (int, optional): Activities moved per transaction
+        log (callable, optional): Receives a progress line per batch
+
+    Returns:
+        tuple: (activities, surveys) archived
+    """
+    if retention_days is None:
+        retention_days = getattr(settings, "API_ARCHIVE_RETENTION_DAYS", 90)
+    before = now() - timedelta(days=retention_days)
+    features = connections[Activity.objects.db].features
+    activities = surveys = 0
+    started = perf_counter()
+    while True:
+        batch_started = perf_counter()
+        with transaction.atomic():
+            queryset = Activity.objects.archivable(before).order_by("pk")
+            if features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                break
+            archived_at = now()
+            ArchivedActivity.objects.bulk_create(
+                ArchivedActivity(archived_at=archived_at, **row)
+                for row in Activity.objects.filter(pk__in=ids).values(*ACTIVITY_COLUMNS)
+            )
+            rows = Survey.objects.filter(activity_id__in=ids)
+            moved = ArchivedSurvey.objects.bulk_create(
+                ArchivedSurvey(**row) for row in rows.values(*SURVEY_COLUMNS)
+            )
+            delete_rows(Survey, "activity", ids)
+            delete_rows(Activity, "id", ids)
+        activities += len(ids)
+        surveys += len(moved)
+        if log:
+            log(
+                f"{len(ids)} activities and {len(moved)} surveys archived "
+                f"({activities} total) in {(perf_counter() - batch_started) * 1000:.1f}ms"
+            )
+    if activities:
+        invalidate(Activity, Survey)  # No signals were sent
+    if log:
+        log(
+            f"Done: {activities} activities and {surveys} surveys in "
+            f"{(perf_counter() - started) * 1000:.1f}ms"
+        )
+    return activities, surveys
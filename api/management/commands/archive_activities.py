@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.maintenance import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the cancelled and done activities older than the retention window "
+        "(and their surveys) to the archive tables in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Retention window in days (API_ARCHIVE_RETENTION_DAYS by default)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Activities moved per transaction",
+        )
+
+    def handle(self, *args, **options):
+        archive(options["days"], options["batch_size"], log=self.stdout.write)
@@ -0,0 +1,254 @@
+import json
+import math
+import re
+import subprocess
+import tracemalloc
+from datetime import timedelta
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from api.models import Activity, Property, Survey
+
+# (name, method, path, body) for each route of api/urls.py, except the
+# browsable API login pages (api-auth/) and PUT, which is not allowed. The path is
+# formatted with the ids picked from the database ({property}, {activity} with
+# a survey, {pending} without one) and body names one of Command.body.
+# Writes are rolled back after every request.
+ROUTES = (
+    ("properties-list", "get", "/api/properties/", None),
+    ("properties-page", "get", "/api/properties/?page_size=100", None),
+    ("properties-search", "get", "/api/properties/?q=suite&page_size=100", None),
+    (
+        "properties-autocomplete",
+        "get",
+        "/api/properties/autocomplete/?prefix=sui",
+        None,
+    ),
+    ("properties-detail", "get", "/api/properties/{property}/", None),
+    ("activities-week", "get", "/api/activities/", None),
+    ("activities-page", "get", "/api/activities/?status=all&page_size=100", None),
+    (
+        "activities-sparse",
+        "get",
+        "/api/activities/?status=all&page_size=100&fields=id,title,schedule,condition",
+        None,
+    ),
+    (
+        "activities-archived",
+        "get",
+        "/api/activities/?status=all&page_size=100&include_archived=1",
+        None,
+    ),
+    ("activities-detail", "get", "/api/activities/{activity}/", None),
+    ("activities-export", "get", "/api/activities/export/", None),
+    ("activity-survey", "get", "/api/activities/{activity}/survey/", None),
+    ("surveys-page", "get", "/api/surveys/?page_size=100", None),
+    ("surveys-answers", "get", "/api/surveys/?answers.rating=5&page_size=100", None),
+    ("surveys-export", "get", "/api/surveys/export/", None),
+    ("property-availability", "get", "/api/properties/{property}/availability/", None),
+    ("property-survey-stats", "get", "/api/properties/{property}/survey-stats/", None),
+    ("properties-create", "post", "/api/properties/", "property"),
+    ("properties-delete", "delete", "/api/properties/{property}/", None),
+    ("activities-create", "post", "/api/activities/", "activity"),
+    ("activities-bulk-create", "post", "/api/activities/", "activities"),
+    ("activities-reschedule", "patch", "/api/activities/{pending}/", "reschedule"),
+    ("activities-cancel", "delete", "/api/activities/{pending}/", None),
+    ("activities-bulk-cancel", "post", "/api/activities/cancel/", "cancel"),
+    ("activity-survey-create", "post", "/api/activities/{pending}/survey/", "survey"),
+    ("property-disable", "post", "/api/properties/{property}/disable/", None),
+    ("async-properties-list", "get", "/api/async/properties/", None),
+    ("async-properties-detail", "get", "/api/async/properties/{property}/", None),
+    ("async-activities-week", "get", "/api/async/activities/", None),
+    ("async-activities-detail", "get", "/api/async/activities/{activity}/", None),
+    ("async-activity-survey", "get", "/api/async/activities/{activity}/survey/", None),
+)
+
+BULK_ITEMS = 20  # Activities of the bulk create body
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    index = max(math.ceil(percent / 100 * len(values)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def timing_queries(response):
+    """Queries of the Server-Timing header (including the ones of worker threads)"""
+    match = re.search(
+        r'db;[^,]*desc="(\d+) queries"', response.get("Server-Timing", "")
+    )
+    return int(match.group(1)) if match else 0
+
+
+class Command(BaseCommand):
+    help = "Measure latency, queries and memory of every API route in-process"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Per route")
+        parser.add_argument("--warmup", type=int, default=3, help="Per route")
+        parser.add_argument("--output", default="bench_output.json")
+        parser.add_argument(
+            "--route", action="append", help="Only run these routes (by name)"
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Keep the response cache enabled (disabled by default)",
+        )
+
+    def handle(self, *args, **options):
+        activity = (
+            Activity.objects.exclude(status="cancelled")
+            .filter(survey__isnull=False)
+            .values_list("id", flat=True)
+            .first()
+        )
+        property_ = (
+            Property.objects.filter(status="Active")
+            .values_list("id", flat=True)
+            .first()
+        )
+        pending = (
+            Activity.objects.exclude(status="cancelled")
+            .filter(survey__isnull=True, schedule__gt=now())
+            .values_list("id", flat=True)
+            .first()
+        )
+        if not activity or not property_ or not pending:
+            raise CommandError("No data to benchmark, run `manage.py seed` first")
+        ids = {"property": property_, "activity": activity, "pending": pending}
+        routes = [
+            route
+            for route in ROUTES
+            if not options["route"] or route[0] in options["route"]
+        ]
+        client = APIClient()
+        # Superuser that is never saved: permissions checks need no query
+        client.force_authenticate(
+            user=User(username="benchmark", is_superuser=True, is_active=True)
+        )
+
+        results = {}
+        with override_settings(
+            ALLOWED_HOSTS=["testserver"], API_CACHE_ENABLED=options["cache"]
+        ):
+            for name, method, path, body in routes:
+                path = path.format(**ids)
+                data = self.body(body, ids)
+                results[name] = self.run_route(client, method, path, data, options)
+                self.stdout.write(
+                    f"{name:<20} p50={results[name]['p50_ms']:.2f}ms "
+                    f"p95={results[name]['p95_ms']:.2f}ms "
+                    f"queries={results[name]['queries']} "
+                    f"peak={results[name]['peak_memory_kb']:.0f}KB"
+                )
+
+        report = {
+            "meta": {
+                "commit": self.commit(),
+                "date": now().isoformat(),
+                "vendor": connection.vendor,
+                "requests": options["requests"],
+                "rows": {
+                    "properties": Property.objects.count(),
+                    "activities": Activity.objects.count(),
+                    "surveys": Survey.objects.count(),
+                },
+            },
+            "routes": results,
+        }
+        with open(options["output"], "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        self.stdout.write(f"Report written to {options['output']}")
+
+    def body(self, name, ids):
+        """Request body of the write routes (None for the rest)"""
+        start = now() + timedelta(days=3650)
+        schedule = start.strftime("%Y-%m-%dT%H:%M")
+        bodies = {
+            "property": {
+                "title": "benchmark",
+                "address": "benchmark",
+                "description": "benchmark",
+            },
+            "activity": {
+                "property": ids["property"],
+                "title": "benchmark",
+                "schedule": schedule,
+            },
+            "activities": [
+                {
+                    "property": ids["property"],
+                    "title": f"benchmark {hours}",
+                    "schedule": (start + timedelta(hours=hours)).strftime(
+                        "%Y-%m-%dT%H:%M"
+                    ),
+                }
+                for hours in range(0, 2 * BULK_ITEMS, 2)
+            ],
+            "reschedule": {"schedule": schedule},
+            "cancel": {"property": ids["property"], "status": "Active"},
+            "survey": {"answers": {"rating": 5, "roof_condition": "good"}},
+        }
+        return bodies.get(name)
+
+    def request(self, client, method, path, data):
+        """One request; writes are rolled back so every run sees the same data"""
+        with transaction.atomic():
+            response = getattr(client, method)(path, data=data, format="json")
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            transaction.set_rollback(True)
+        return response
+
+    def run_route(self, client, method, path, data, options):
+        for _ in range(options["warmup"]):
+            self.request(client, method, path, data)
+
+        latencies = []
+        for _ in range(options["requests"]):
+            started = perf_counter()
+            response = self.request(client, method, path, data)
+            latencies.append((perf_counter() - started) * 1000)
+        latencies.sort()
+
+        # Queries and memory are measured apart: tracing slows the requests down
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request(client, method, path, data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        captured = [q for q in queries.captured_queries if "SAVEPOINT" not in q["sql"]]
+
+        return {
+            "method": method.upper(),
+            "path": path,
+            "status": response.status_code,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "mean_ms": sum(latencies) / len(latencies),
+            # Async routes query from the pool threads, see the Server-Timing
+            "queries": len(captured) or timing_queries(response),
+            "peak_memory_kb": peak / 1024,
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
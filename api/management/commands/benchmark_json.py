@@ -0,0 +1,76 @@
+import io
+import json
+from timeit import Timer
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.models import Activity, Survey
+from api.renderers import FastJSONParser, FastJSONRenderer, orjson
+from api.serializers import ActivitySerializer, SurveySerializer
+
+
+class Command(BaseCommand):
+    help = "Compare the stdlib and the orjson renderer/parser on list payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="Rows per payload")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--output", help="Write the results as JSON")
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write("orjson is not installed: both use the stdlib")
+        context = {"request": Request(APIRequestFactory().get("/api/"))}
+        rows = options["rows"]
+        payloads = {
+            "activities": ActivitySerializer.from_values(
+                ActivitySerializer.values(
+                    Activity.objects.for_listing().order_by("id")[:rows]
+                ),
+                context,
+            ),
+            "surveys": SurveySerializer.from_values(
+                SurveySerializer.values(Survey.objects.order_by("id")[:rows])
+            ),
+        }
+        if not all(payloads.values()):
+            raise CommandError("No data to benchmark, run `manage.py seed` first")
+
+        results = {}
+        for name, data in payloads.items():
+            body = {"status": "OK", "count": len(data), "data": data}
+            rendered = JSONRenderer().render(body)
+            if FastJSONRenderer().render(body) != rendered:
+                raise CommandError(f"Different output for {name}")
+            results[name] = {
+                "rows": len(data),
+                "bytes": len(rendered),
+                "render_stdlib_ms": self.time(JSONRenderer().render, body, options),
+                "render_fast_ms": self.time(FastJSONRenderer().render, body, options),
+                "parse_stdlib_ms": self.time(
+                    lambda: JSONParser().parse(io.BytesIO(rendered)), None, options
+                ),
+                "parse_fast_ms": self.time(
+                    lambda: FastJSONParser().parse(io.BytesIO(rendered)), None, options
+                ),
+            }
+            result = results[name]
+            self.stdout.write(
+                f"{name}: {result['rows']} rows, {result['bytes']} bytes | "
+                f"render {result['render_stdlib_ms']:.2f}ms -> "
+                f"{result['render_fast_ms']:.2f}ms | "
+                f"parse {result['parse_stdlib_ms']:.2f}ms -> "
+                f"{result['parse_fast_ms']:.2f}ms"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+
+    def time(self, fn, data, options):
+        """Best time of --repeat calls, in milliseconds"""
+        call = fn if data is None else (lambda: fn(data))
+        return min(Timer(call).repeat(repeat=options["repeat"], number=1)) * 1000
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.maintenance import mark_overdue
+
+
+class Command(BaseCommand):
+    help = "Move the past-due Pending activities to Overdue in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Activities updated per UPDATE statement",
+        )
+
+    def handle(self, *args, **options):
+        mark_overdue(options["batch_size"], log=self.stdout.write)
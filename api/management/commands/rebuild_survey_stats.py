@@ -0,0 +1,19 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from api.aggregates import rebuild_answer_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute the survey answer counts per property and question"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        rows = rebuild_answer_counts(batch_size=options["batch_size"])
+        self.stdout.write(
+            f"Done: {rows} answer counts in {(perf_counter() - started) * 1000:.1f}ms"
+        )
@@ -0,0 +1,107 @@
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+from faker import Faker
+
+from api.aggregates import rebuild_answer_counts
+from api.cache import invalidate
+from api.models import Activity, Property, Survey
+
+ANSWERS = {
+    "roof_condition": ("good", "fair", "poor"),
+    "pest_control": ("yes", "no"),
+    "rating": (1, 2, 3, 4, 5),
+}
+
+
+def batches(objects, size):
+    while batch := list(islice(objects, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Bulk insert fake properties, activities and surveys for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--properties", type=int, default=10_000)
+        parser.add_argument("--activities", type=int, default=1_000_000)
+        parser.add_argument("--surveys", type=int, default=200_000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        fake = Faker()
+        Faker.seed(options["seed"])
+        # Faker is slow: build a pool of texts and combine them
+        self.titles = [fake.sentence(nb_words=3) for _ in range(500)]
+        self.addresses = [fake.address() for _ in range(2000)]
+        self.descriptions = [fake.paragraph(nb_sentences=5) for _ in range(200)]
+        size = options["batch_size"]
+
+        first = (
+            Property.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        ) + 1
+        for batch in batches(self.properties(options["properties"]), size):
+            Property.objects.bulk_create(batch)
+        property_ids = list(
+            Property.objects.filter(id__gte=first).values_list("id", flat=True)
+        )
+        self.stdout.write(f"{len(property_ids)} properties")
+
+        first = (
+            Activity.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        ) + 1
+        for batch in batches(
+            self.activities(property_ids, options["activities"]), size
+        ):
+            Activity.objects.bulk_create(batch)
+        self.stdout.write(f"{options['activities']} activities")
+
+        activity_ids = (
+            Activity.objects.filter(id__gte=first)
+            .exclude(status="cancelled")
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        surveys = (
+            Survey(activity_id=pk, answers=self.answers())
+            for pk in activity_ids[: options["surveys"]].iterator(chunk_size=size)
+        )
+        created = 0
+        for batch in batches(surveys, size):
+            Survey.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(f"{created} surveys")
+        self.stdout.write(f"{rebuild_answer_counts(size)} survey answer counts")
+        invalidate(Property, Activity, Survey)
+
+    def properties(self, amount):
+        for _ in range(amount):
+            yield Property(
+                title=self.random.choice(self.titles),
+                address=self.random.choice(self.addresses),
+                description=self.random.choice(self.descriptions),
+                status=self.random.choices(("Active", "Inactive"), (9, 1))[0],
+            )
+
+    def activities(self, property_ids, amount):
+        """Activities spread over the properties, two hours apart per property"""
+        start = now().replace(minute=0, second=0, microsecond=0)
+        per_property = max(amount // max(len(property_ids), 1), 1)
+        start -= timedelta(hours=per_property)  # Half in the past
+        for i in range(amount if property_ids else 0):
+            schedule = start + timedelta(hours=2 * (i // len(property_ids)))
+            yield Activity(
+                property_id=property_ids[i % len(property_ids)],
+                title=self.random.choice(self.titles),
+                schedule=schedule,
+                status="cancelled" if self.random.random() < 0.1 else "Active",
+                condition="Overdue" if schedule < now() else "Pending",
+            )
+
+    def answers(self):
+        return {key: self.random.choice(values) for key, values in ANSWERS.items()}
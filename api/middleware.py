@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+
+logger = logging.getLogger("api.timing")
+
+_timings = ContextVar("api_timings", default=None)
+
+
+class RequestTimings:
+    """Queries and timed spans of the current request"""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = []  # (sql, params, seconds)
+        self.spans = Counter()  # name -> seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook"""
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, repr(params), perf_counter() - started))
+
+    @property
+    def db_time(self):
+        return sum(query[2] for query in self.queries)
+
+    def duplicates(self):
+        """Identical statements (same SQL and params) executed more than once
+
+        Returns:
+            dict: {sql: times executed}
+        """
+        counter = Counter((sql, params) for sql, params, _ in self.queries)
+        return {sql: times for (sql, _), times in counter.items() if times > 1}
+
+    def metrics(self):
+        """Name, milliseconds and description of each Server-Timing metric"""
+        total = perf_counter() - self.started
+        render = self.spans.get("render", 0)
+        serialize = self.spans.get("serialize", 0)
+        metrics = [
+            ("db", self.db_time, f"{len(self.queries)} queries"),
+            ("serialize", serialize, None),
+            ("render", render, None),
+            ("view", total - self.db_time - serialize - render, None),
+            ("total", total, None),
+        ]
+        if duplicates := self.duplicates():
+            metrics.append(("dup", 0, f"{sum(duplicates.values())} duplicated queries"))
+        return [(name, seconds * 1000, desc) for name, seconds, desc in metrics]
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper of every connection (connection_created receiver below)
+
+    Queries are recorded in the RequestTimings of the context, so the ones run
+    by worker threads (sync_to_async, the async views pool) are counted too.
+    """
+    if (timings := _timings.get()) is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created receiver"""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def current_timings():
+    """RequestTimings of the request being handled (None outside of a request)"""
+    return _timings.get()
+
+
+@contextmanager
+def timing(name):
+    """Add the time spent in the block to the ``name`` span of the request
+
+    Queries run inside the block are left out (they are reported as db time).
+    """
+    if (timings := _timings.get()) is None:
+        yield
+        return
+    started, db_time = perf_counter(), timings.db_time
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - started - (timings.db_time - db_time)
+        timings.spans[name] += elapsed
+
+
+def server_timing(metrics):
+    entries = []
+    for name, milliseconds, desc in metrics:
+        entry = f"{name};dur={milliseconds:.2f}"
+        if desc:
+            entry += f';desc="{desc}"'
+        entries.append(entry)
+    return ", ".join(entries)
+
+
+class TimingMiddleware:
+    """Measure the queries, the DB time and the serialization time of each request
+
+    The metrics are sent in the Server-Timing header (db, serialize, render,
+    view, total and dup when identical queries were repeated) and, with
+    API_TIMING_LOG, logged as one structured line by the "api.timing" logger.
+    Duplicated queries are always logged as warnings.
+
+    The body of streaming responses (exports) is produced after the middleware
+    returns, so only the queries issued before streaming are counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Same marker as MiddlewareMixin: the handler awaits this middleware
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not getattr(settings, "API_TIMING_ENABLED", True):
+            return self.get_response(request)
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        if not getattr(settings, "API_TIMING_ENABLED", True):
+            return await self.get_response(request)
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        metrics = timings.metrics()
+        response.timings = timings
+        response["Server-Timing"] = server_timing(metrics)
+        self.log(request, response, timings, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        """Time the rendering of DRF responses (done after the view returns)"""
+        if (timings := _timings.get()) is not None:
+            started = perf_counter()
+
+            def rendered(response):
+                timings.spans["render"] += perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def log(self, request, response, timings, metrics):
+        if duplicates := timings.duplicates():
+            logger.warning(
+                "Duplicated queries in %s %s: %s",
+                request.method,
+                request.path,
+                duplicates,
+            )
+        if getattr(settings, "API_TIMING_LOG", False):
+            logger.info(
+                "%s %s %s",
+                request.method,
+                request.get_full_path(),
+                response.status_code,
+                extra={
+                    "status_code": response.status_code,
+                    "queries": len(timings.queries),
+                    "duplicates": sum(duplicates.values()),
+                    **{f"{name}_ms": round(ms, 2) for name, ms, _ in metrics},
+                },
+            )
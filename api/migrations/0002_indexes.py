@@ -0,0 +1,51 @@
+# Generated by Django 3.2.5 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(
+                condition=models.Q(("status", "cancelled"), _negated=True),
+                fields=["property", "schedule"],
+                name="activity_schedule_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(
+                fields=["status", "condition", "schedule"], name="activity_filters_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["schedule", "id"], name="activity_keyset_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["created_at"], name="activity_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(
+                fields=["created_at", "id"], name="property_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(
+                fields=["status", "created_at"], name="property_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="survey",
+            index=models.Index(fields=["created_at", "id"], name="survey_created_idx"),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Activities last up to an hour: two active activities of the same property
+# collide when their [schedule, schedule + 1h] ranges (bounds included) overlap,
+# which is the same +/- one hour rule ActivitySerializer validates. Postgres
+# only, other backends rely on Property.lock_schedule() around the check.
+CREATE_CONSTRAINT = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE api_activity ADD CONSTRAINT activity_no_overlap EXCLUDE USING gist (
+    property_id WITH =,
+    tstzrange(schedule, schedule + interval '1 hour', '[]') WITH &&
+) WHERE (status <> 'cancelled');
+"""
+
+DROP_CONSTRAINT = "ALTER TABLE api_activity DROP CONSTRAINT activity_no_overlap;"
+
+
+def create_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_CONSTRAINT)
+
+
+def drop_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_constraint, drop_constraint),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# Containment queries on the answers (answers @> '{"roof_condition": "poor"}')
+# use this index. jsonb_path_ops is smaller and faster than the default
+# operator class and supports @>, the only operator the filters emit.
+# Postgres only, other backends filter the answers with key lookups.
+CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS survey_answers_gin
+ON api_survey USING gin (answers jsonb_path_ops);
+"""
+
+DROP_INDEX = "DROP INDEX IF EXISTS survey_answers_gin;"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_activity_no_overlap"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
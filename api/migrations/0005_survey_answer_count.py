@@ -0,0 +1,44 @@
+# Generated by Django 3.2.5 on 2026-10-18 17:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_survey_answers_gin"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SurveyAnswerCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("question", models.CharField(max_length=255)),
+                ("answer", models.CharField(max_length=255)),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "property",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="api.property"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="surveyanswercount",
+            constraint=models.UniqueConstraint(
+                fields=("property", "question", "answer"),
+                name="survey_answer_count_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,109 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+# search_vector is kept up to date by a trigger (title A, address B,
+# description C weights) and served by a GIN index on Postgres. SQLite keeps
+# an FTS5 index (api_property_fts) in sync with its own triggers instead; the
+# search_vector column stays empty there.
+POSTGRES_CREATE = [
+    """
+    CREATE OR REPLACE FUNCTION api_property_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.address, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER api_property_search_vector
+    BEFORE INSERT OR UPDATE OF title, address, description ON api_property
+    FOR EACH ROW EXECUTE PROCEDURE api_property_search_vector();
+    """,
+    "UPDATE api_property SET title = title;",
+    """
+    CREATE INDEX IF NOT EXISTS property_search_gin
+    ON api_property USING gin (search_vector);
+    """,
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS property_search_gin;",
+    "DROP TRIGGER IF EXISTS api_property_search_vector ON api_property;",
+    "DROP FUNCTION IF EXISTS api_property_search_vector();",
+]
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE api_property_fts USING fts5(
+        title, address, description,
+        content='api_property', content_rowid='id', tokenize='porter unicode61'
+    );
+    """,
+    """
+    CREATE TRIGGER api_property_fts_insert AFTER INSERT ON api_property BEGIN
+        INSERT INTO api_property_fts(rowid, title, address, description)
+        VALUES (new.id, new.title, new.address, new.description);
+    END;
+    """,
+    """
+    CREATE TRIGGER api_property_fts_delete AFTER DELETE ON api_property BEGIN
+        INSERT INTO api_property_fts(api_property_fts, rowid, title, address, description)
+        VALUES ('delete', old.id, old.title, old.address, old.description);
+    END;
+    """,
+    """
+    CREATE TRIGGER api_property_fts_update
+    AFTER UPDATE OF title, address, description ON api_property BEGIN
+        INSERT INTO api_property_fts(api_property_fts, rowid, title, address, description)
+        VALUES ('delete', old.id, old.title, old.address, old.description);
+        INSERT INTO api_property_fts(rowid, title, address, description)
+        VALUES (new.id, new.title, new.address, new.description);
+    END;
+    """,
+    "INSERT INTO api_property_fts(api_property_fts) VALUES ('rebuild');",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS api_property_fts_insert;",
+    "DROP TRIGGER IF EXISTS api_property_fts_delete;",
+    "DROP TRIGGER IF EXISTS api_property_fts_update;",
+    "DROP TABLE IF EXISTS api_property_fts;",
+]
+
+STATEMENTS = {
+    "postgresql": (POSTGRES_CREATE, POSTGRES_DROP),
+    "sqlite": (SQLITE_CREATE, SQLITE_DROP),
+}
+
+
+def create_search(apps, schema_editor):
+    create, _ = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for statement in create:
+        schema_editor.execute(statement)
+
+
+def drop_search(apps, schema_editor):
+    _, drop = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for statement in drop:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_survey_answer_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="property",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
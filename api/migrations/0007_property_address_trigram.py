@@ -0,0 +1,82 @@
+from django.db import migrations
+
+# Address autocomplete (substring match). Postgres: trigram GIN index on the
+# same UPPER(address) expression icontains/istartswith compare. SQLite (3.34+):
+# an FTS5 trigram index (api_property_address) kept in sync by triggers.
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    """
+    CREATE INDEX IF NOT EXISTS property_address_trgm
+    ON api_property USING gin (UPPER(address) gin_trgm_ops);
+    """,
+]
+
+POSTGRES_DROP = ["DROP INDEX IF EXISTS property_address_trgm;"]
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE api_property_address USING fts5(
+        address, content='api_property', content_rowid='id', tokenize='trigram'
+    );
+    """,
+    """
+    CREATE TRIGGER api_property_address_insert AFTER INSERT ON api_property BEGIN
+        INSERT INTO api_property_address(rowid, address) VALUES (new.id, new.address);
+    END;
+    """,
+    """
+    CREATE TRIGGER api_property_address_delete AFTER DELETE ON api_property BEGIN
+        INSERT INTO api_property_address(api_property_address, rowid, address)
+        VALUES ('delete', old.id, old.address);
+    END;
+    """,
+    """
+    CREATE TRIGGER api_property_address_update
+    AFTER UPDATE OF address ON api_property BEGIN
+        INSERT INTO api_property_address(api_property_address, rowid, address)
+        VALUES ('delete', old.id, old.address);
+        INSERT INTO api_property_address(rowid, address) VALUES (new.id, new.address);
+    END;
+    """,
+    "INSERT INTO api_property_address(api_property_address) VALUES ('rebuild');",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS api_property_address_insert;",
+    "DROP TRIGGER IF EXISTS api_property_address_delete;",
+    "DROP TRIGGER IF EXISTS api_property_address_update;",
+    "DROP TABLE IF EXISTS api_property_address;",
+]
+
+
+def statements(connection):
+    if connection.vendor == "postgresql":
+        return POSTGRES_CREATE, POSTGRES_DROP
+    if connection.vendor == "sqlite":
+        # FTS5 trigram tokenizer, same check as api.filters.address_contains
+        if connection.Database.sqlite_version_info >= (3, 34):
+            return SQLITE_CREATE, SQLITE_DROP
+    return (), ()
+
+
+def create_index(apps, schema_editor):
+    create, _ = statements(schema_editor.connection)
+    for statement in create:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    _, drop = statements(schema_editor.connection)
+    for statement in drop:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_property_search"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.5 on 2026-10-18 18:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_property_address_trigram"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedActivity",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("schedule", models.DateTimeField()),
+                ("title", models.TextField(max_length=255)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField(null=True)),
+                ("status", models.CharField(max_length=35)),
+                ("condition", models.CharField(max_length=35)),
+                (
+                    "archived_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "property",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_activities",
+                        to="api.property",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedSurvey",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("answers", models.JSONField()),
+                ("created_at", models.DateTimeField()),
+                (
+                    "activity",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="survey",
+                        to="api.archivedactivity",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archivedsurvey",
+            index=models.Index(fields=["created_at", "id"], name="archived_survey_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedactivity",
+            index=models.Index(fields=["schedule", "id"], name="archived_keyset_idx"),
+        ),
+    ]
@@ -1,40 +1,228 @@
-from django.db import models
+from datetime import timedelta
+
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models
+from django.conf import settings
+from django.db.models import Case, CharField, Exists, F, OuterRef, Q, Value, When
 from django.utils.timezone import now
 
 # Create your models here.
 
 
+class PropertyQuerySet(models.QuerySet):
+    def lock_schedule(self):
+        """Lock the selected properties until the current transaction ends
+
+        Activities of a property are checked for overlaps and then written, so
+        concurrent writers for the same property must be serialized. Must be
+        called inside ``transaction.atomic()``.
+
+        Returns:
+            QuerySet: The (locked) properties
+        """
+        if connections[self.db].features.has_select_for_update:
+            return self.select_for_update()
+        # SQLite has no row locks: a no-op write takes the database write lock
+        # now (like BEGIN IMMEDIATE) instead of at insert time.
+        self.update(status=F("status"))
+        return self
+
+    def disable(self):
+        """Set the selected properties Inactive and cancel their future activities
+
+        One UPDATE per table, call it inside ``transaction.atomic()``. Writes
+        made with update() send no signals: invalidate the cached responses.
+
+        Returns:
+            tuple: (properties disabled, activities cancelled)
+        """
+        moment = now()
+        activities = Activity.objects.filter(
+            property__in=self, schedule__gte=moment
+        ).cancel()
+        properties = self.update(
+            status="Inactive", disabled_at=moment, updated_at=moment
+        )
+        return properties, activities
+
+
 class Property(models.Model):
     title = models.CharField(
         max_length=255,
     )
     address = models.TextField()
     description = models.TextField()
-    created_at = models.DateTimeField(default=now())
-    updated_at = models.DateTimeField(default=now())
+    created_at = models.DateTimeField(default=now)
+    updated_at = models.DateTimeField(default=now)
     disabled_at = models.DateTimeField(null=True)
     status = models.CharField(max_length=35, default="Active")
+    # title, address and description for ?q=, maintained by a database trigger
+    # (migration 0006, SQLite keeps the api_property_fts table instead)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = PropertyQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # List ordering and keyset pagination
+            models.Index(fields=["created_at", "id"], name="property_created_idx"),
+            # ?status= filter ordered by created_at
+            models.Index(fields=["status", "created_at"], name="property_status_idx"),
+        ]
 
     def __str__(self):
         return f"{self.id}, {self.address}, {self.description}"
 
 
+def live_condition(prefix=""):
+    """SQL expression of the condition as of now (Pending turns Overdue once due)
+
+    Args:
+        prefix (str, optional): Lookup path to the activity (e.g. "activity__")
+    """
+    return Case(
+        When(
+            Q(**{f"{prefix}condition": "Pending", f"{prefix}schedule__lt": now()}),
+            then=Value("Overdue"),
+        ),
+        default=F(f"{prefix}condition"),
+        output_field=CharField(),
+    )
+
+
+def computed_condition():
+    """Whether the condition is computed at read time (API_CONDITION_MODE)"""
+    return getattr(settings, "API_CONDITION_MODE", "stored") == "computed"
+
+
+def condition_due():
+    """Rows whose representation changes by itself once a timestamp is passed
+
+    In computed mode a Pending activity reads as Overdue after its schedule,
+    without any write (updated_at and the cache generations stay the same), so
+    validators and cache entries must take the schedule into account.
+
+    Returns:
+        tuple: (timestamp field, lookups of the rows) or None in stored mode
+    """
+    return ("schedule", {"condition": "Pending"}) if computed_condition() else None
+
+
+class ActivityQuerySet(models.QuerySet):
+    def for_listing(self, fields=None):
+        """Join the property and flag survey existence in the same query
+
+        Args:
+            fields (tuple, optional): Serialized fields (sparse fieldset), the
+                joins and annotations of the other ones are left out
+
+        Returns:
+            QuerySet: Activities with ``property`` loaded and ``has_survey`` annotated
+                (and ``live_condition`` in the computed condition mode)
+        """
+        queryset = self
+        surveys = self.model._meta.get_field("survey").related_model.objects
+        if fields is None or "property" in fields:
+            queryset = queryset.select_related("property")
+        if fields is None or "survey" in fields:
+            queryset = queryset.annotate(
+                has_survey=Exists(surveys.filter(activity_id=OuterRef("pk")))
+            )
+        if computed_condition() and (fields is None or "condition" in fields):
+            queryset = queryset.annotate(live_condition=live_condition())
+        return queryset
+
+    def overdue(self):
+        """Pending activities whose schedule already passed"""
+        return self.filter(condition="Pending", schedule__lt=now())
+
+    def overlapping(self, property_id, schedule, exclude_pk=None):
+        """Active activities of a property that could cross the given schedule
+
+        Activities can last up to an hour, so any activity scheduled one hour
+        before or after (inclusive) collides. Postgres also enforces this rule
+        with the activity_no_overlap exclusion constraint.
+
+        Args:
+            property_id (int): Property of the activity
+            schedule (datetime): Schedule to check
+            exclude_pk (int, optional): Activity being rescheduled
+
+        Returns:
+            QuerySet: Colliding activities
+        """
+        queryset = self.scheduled_between(
+            property_id, schedule - timedelta(hours=1), schedule + timedelta(hours=1)
+        )
+        if exclude_pk is not None:
+            queryset = queryset.exclude(pk=exclude_pk)
+        return queryset
+
+    def cancel(self):
+        """Cancel the selected activities with a single UPDATE
+
+        Returns:
+            int: Activities cancelled (the already cancelled ones are left out)
+        """
+        return self.exclude(status="cancelled").update(
+            status="cancelled", updated_at=now()
+        )
+
+    def archivable(self, before):
+        """Cancelled and done activities scheduled before a date (see archive)"""
+        return self.filter(
+            Q(status="cancelled") | Q(status="Done") | Q(condition="Done"),
+            schedule__lt=before,
+        )
+
+    def scheduled_between(self, property_id, start, end):
+        """Active activities of a property scheduled in [start, end]
+
+        Served by the partial activity_schedule_idx index.
+        """
+        return (
+            self.exclude(status="cancelled")
+            .filter(property_id=property_id)
+            .filter(schedule__range=(start, end))
+        )
+
+
 class Activity(models.Model):
     # I needed to add null=True
     property = models.ForeignKey(Property, on_delete=models.CASCADE, null=True)
-    schedule = models.DateTimeField(default=now())
+    schedule = models.DateTimeField(default=now)
     title = models.TextField(max_length=255)
-    created_at = models.DateTimeField(default=now())
-    updated_at = models.DateTimeField(default=now(), null=True)
+    created_at = models.DateTimeField(default=now)
+    updated_at = models.DateTimeField(default=now, null=True)
     status = models.CharField(max_length=35, default="Active")
     condition = models.CharField(
         max_length=35, default="Pending"
     )  # Pending, Overdue, Done
 
+    objects = ActivityQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Overlap check on create/reschedule, cancelled rows never conflict
+            models.Index(
+                fields=["property", "schedule"],
+                name="activity_schedule_idx",
+                condition=~Q(status="cancelled"),
+            ),
+            # ?status=&condition=&schedule_from=&schedule_to= list filters
+            models.Index(
+                fields=["status", "condition", "schedule"],
+                name="activity_filters_idx",
+            ),
+            # Weekly window and keyset pagination
+            models.Index(fields=["schedule", "id"], name="activity_keyset_idx"),
+            models.Index(fields=["created_at"], name="activity_created_idx"),
+        ]
+
     def cancel(self):
         self.status = "cancelled"
         self.updated_at = now()
-        self.save()
+        self.save(update_fields=["status", "updated_at"])
 
     def __str__(self):
         return f"{self.id}, {self.property_id}, {self.title}"
@@ -43,7 +231,93 @@ class Activity(models.Model):
 class Survey(models.Model):
     activity = models.OneToOneField(Activity, on_delete=models.CASCADE)
     answers = models.JSONField()
-    created_at = models.DateTimeField(default=now())
+    created_at = models.DateTimeField(default=now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="survey_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.id}, {self.activity_id}, {self.answers}"
+
+
+class SurveyAnswerCount(models.Model):
+    """Surveys of a property that gave an answer to a question
+
+    Kept current by api.aggregates.count_answers when a survey is created, and
+    rebuilt from the surveys with `manage.py rebuild_survey_stats`.
+    """
+
+    property = models.ForeignKey(Property, on_delete=models.CASCADE)
+    question = models.CharField(max_length=255)  # Nested keys joined by "."
+    answer = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["property", "question", "answer"],
+                name="survey_answer_count_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.property_id}, {self.question}, {self.answer}: {self.count}"
+
+
+class ArchivedActivityQuerySet(ActivityQuerySet):
+    def for_listing(self, fields=None):
+        """Same as ActivityQuerySet.for_listing, rows flagged as ``archived``"""
+        return super().for_listing(fields).annotate(archived=Value(True))
+
+
+class ArchivedActivity(models.Model):
+    """Activity moved out of the hot table by api.maintenance.archive
+
+    Same columns and ids as Activity (archived_at added), read with
+    ?include_archived=1.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    property = models.ForeignKey(
+        Property,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name="archived_activities",
+    )
+    schedule = models.DateTimeField()
+    title = models.TextField(max_length=255)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(null=True)
+    status = models.CharField(max_length=35)
+    condition = models.CharField(max_length=35)
+    archived_at = models.DateTimeField(default=now)
+
+    objects = ArchivedActivityQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of ?include_archived=1 lists
+            models.Index(fields=["schedule", "id"], name="archived_keyset_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id}, {self.property_id}, {self.title} (archived)"
+
+
+class ArchivedSurvey(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    activity = models.OneToOneField(
+        ArchivedActivity, on_delete=models.CASCADE, related_name="survey"
+    )
+    answers = models.JSONField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="archived_survey_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id}, {self.activity_id}, {self.answers} (archived)"
@@ -0,0 +1,159 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework import serializers
+
+from .responses import ErrorMsg
+
+
+class KeysetPagination:
+    """Opt-in cursor pagination over a fixed, unique ordering
+
+    The page is located with a ``WHERE (key) > (last key)`` filter instead of an
+    OFFSET, so reading any page costs O(page_size) no matter how deep it is.
+    Pagination is only applied when ``cursor`` or ``page_size`` is received and
+    the total ``count`` is only computed when ``count`` is truthy.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    count_query_param = "count"
+    query_params = {cursor_query_param, page_size_query_param, count_query_param}
+
+    def __init__(self, request, ordering):
+        """
+        Args:
+            request (Request): Current request
+            ordering (tuple): Fields of the key, the last one must be unique
+                (e.g. ("created_at", "id")). Prefix with "-" for descending order.
+        """
+        self.request = request
+        self.ordering = ordering
+        self.next_cursor = None
+        params = request.query_params
+        self.requested = any(
+            params.get(param)
+            for param in (self.cursor_query_param, self.page_size_query_param)
+        )
+        self.with_count = params.get(self.count_query_param, "").lower() in {
+            "1",
+            "true",
+        }
+        self.page_size = self.get_page_size()
+
+    def get_page_size(self):
+        default = getattr(settings, "API_PAGE_SIZE", 100)
+        limit = getattr(settings, "API_MAX_PAGE_SIZE", 1000)
+        page_size = self.request.query_params.get(self.page_size_query_param)
+        if not page_size:
+            return default
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            page_size = 0
+        if not 0 < page_size <= limit:
+            raise serializers.ValidationError(
+                {
+                    "error": ErrorMsg.INVALID_VALUE.format(self.page_size_query_param),
+                    "max": limit,
+                }
+            )
+        return page_size
+
+    def paginate_queryset(self, queryset):
+        """Order the queryset by the key and keep the rows after the cursor
+
+        Args:
+            queryset (QuerySet): Filtered queryset
+
+        Returns:
+            QuerySet: Ordered queryset sliced to page_size + 1 rows (the extra row
+                tells whether there is a next page)
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if cursor := self.request.query_params.get(self.cursor_query_param):
+            try:
+                queryset = queryset.filter(self.after(self.decode(cursor)))
+            except (DjangoValidationError, TypeError, ValueError):
+                # Decodable but tampered: values that do not fit the key fields
+                raise self.invalid_cursor()
+        return queryset[: self.page_size + 1]
+
+    def get_page(self, rows):
+        """Trim the extra row and remember the cursor of the next page
+
+        Args:
+            rows (list): Rows fetched from paginate_queryset (models or dicts)
+
+        Returns:
+            list: Rows of the current page
+        """
+        rows = list(rows)
+        if len(rows) > self.page_size:
+            rows = rows[: self.page_size]
+            self.next_cursor = self.encode(rows[-1])
+        return rows
+
+    def merge(self, pages):
+        """Rows of several paginated querysets (e.g. live and archived rows)
+
+        Each queryset went through paginate_queryset, so the first page_size + 1
+        rows of their union in key order are the rows of the page.
+
+        Args:
+            pages (list): Rows of each queryset (models or dicts)
+
+        Returns:
+            list: page_size + 1 rows at most, ordered by the key
+        """
+        if len(pages) == 1:
+            return pages[0]
+        rows = [row for page in pages for row in page]
+        for field in reversed(self.ordering):  # Stable sorts, last key first
+            name = field.lstrip("-")
+            rows.sort(
+                key=lambda row: row[name]
+                if isinstance(row, dict)
+                else getattr(row, name),
+                reverse=field.startswith("-"),
+            )
+        return rows[: self.page_size + 1]
+
+    def after(self, values):
+        """Build (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... for the key"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def encode(self, row):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip("-")
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode(self, cursor):
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise self.invalid_cursor()
+        return values
+
+    def invalid_cursor(self):
+        return serializers.ValidationError(
+            {"error": ErrorMsg.INVALID_VALUE.format(self.cursor_query_param)}
+        )
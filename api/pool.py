@@ -0,0 +1,206 @@
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    """No connection was released before the pool timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections
+
+    Keeps up to ``size`` idle connections open and opens up to ``max_overflow``
+    more under load (closed again when released). When every connection is in
+    use, a checkout waits up to ``timeout`` seconds and raises PoolTimeout.
+
+    Counters (see stats()): checkouts, waits (checkouts that had to wait),
+    timeouts, created and discarded connections.
+    """
+
+    def __init__(
+        self,
+        connect,
+        size=5,
+        max_overflow=10,
+        timeout=30,
+        recycle=None,
+        check=None,
+        reset=None,
+    ):
+        """
+        Args:
+            connect (callable): Opens a new connection
+            size (int, optional): Idle connections kept open
+            max_overflow (int, optional): Extra connections allowed under load
+            timeout (float, optional): Seconds to wait for a connection
+            recycle (float, optional): Max age in seconds of a connection
+            check (callable, optional): Raises when a connection is not usable,
+                called before handing out an idle connection (health check)
+            reset (callable, optional): Cleans a connection when it is released
+                (e.g. rollback)
+        """
+        self.connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.check = check
+        self.reset = reset
+        self.idle = deque()  # (connection, created)
+        self.created_at = {}  # id(connection) -> created
+        self.in_use = 0
+        self.condition = threading.Condition()
+        self.counters = dict.fromkeys(
+            ("checkouts", "waits", "timeouts", "created", "discarded"), 0
+        )
+
+    def acquire(self):
+        """Check out a connection (idle, new, or the next one released)
+
+        Raises:
+            PoolTimeout: Every connection stayed in use for ``timeout`` seconds
+        """
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            self.counters["checkouts"] += 1
+            waited = False
+            while not self.idle and self.in_use >= self.size + self.max_overflow:
+                if not waited:
+                    self.counters["waits"] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No connection available after {self.timeout}s "
+                        f"({self.in_use} in use)"
+                    )
+                self.condition.wait(remaining)
+            self.in_use += 1
+            idle = self.idle.popleft() if self.idle else None
+        try:
+            if idle is not None and (connection := self.validate(*idle)) is not None:
+                return connection
+            return self.open()
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, connection, discard=False):
+        """Return a connection, closing it when broken, too old or in overflow"""
+        if not discard and self.reset is not None:
+            try:
+                self.reset(connection)
+            except Exception:
+                discard = True
+        created = self.created_at.get(id(connection), 0)
+        with self.condition:
+            self.in_use -= 1
+            keep = not discard and len(self.idle) < self.size
+            if keep and not self.expired(created):
+                self.idle.append((connection, created))
+                connection = None
+            self.condition.notify()
+        if connection is not None:
+            self.close(connection)
+
+    def validate(self, connection, created):
+        """The idle connection if it is still usable, else None (closed)"""
+        if self.expired(created):
+            self.close(connection)
+            return None
+        if self.check is not None:
+            try:
+                self.check(connection)
+            except Exception:
+                self.close(connection)
+                return None
+        return connection
+
+    def expired(self, created):
+        return self.recycle is not None and time.monotonic() - created > self.recycle
+
+    def open(self):
+        connection = self.connect()
+        self.created_at[id(connection)] = time.monotonic()
+        with self.condition:
+            self.counters["created"] += 1
+        return connection
+
+    def close(self, connection):
+        self.created_at.pop(id(connection), None)
+        with self.condition:
+            self.counters["discarded"] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def clear(self):
+        """Close the idle connections"""
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+        for connection, _ in idle:
+            self.close(connection)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counters plus the connections in use and idle
+        """
+        with self.condition:
+            return dict(self.counters, in_use=self.in_use, idle=len(self.idle))
+
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_pool(alias, connect, options):
+    """Pool of a database alias, created on first use
+
+    Args:
+        alias (str): Database alias (and database name)
+        connect (callable): Opens a new connection
+        options (dict): POOL entry of the database settings (SIZE,
+            MAX_OVERFLOW, TIMEOUT, RECYCLE) plus check and reset callables
+    """
+    with _lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(
+                connect,
+                size=options.get("SIZE", 5),
+                max_overflow=options.get("MAX_OVERFLOW", 10),
+                timeout=options.get("TIMEOUT", 30),
+                recycle=options.get("RECYCLE"),
+                check=options.get("check"),
+                reset=options.get("reset"),
+            )
+        return _pools[alias]
+
+
+def close_pools(database=None):
+    """Close the idle connections of every pool (or of one database)"""
+    with _lock:
+        pools = [
+            pool
+            for key, pool in _pools.items()
+            if database is None or key.endswith(f"/{database}")
+        ]
+    for pool in pools:
+        pool.clear()
+
+
+def pool_stats():
+    """Metrics of every connection pool
+
+    Returns:
+        dict: {alias: {checkouts, waits, timeouts, created, discarded, in_use, idle}}
+    """
+    with _lock:
+        return {alias: pool.stats() for alias, pool in _pools.items()}
@@ -0,0 +1,55 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # The stdlib renderer and parser are used instead
+    orjson = None
+
+if orjson:
+    # Datetimes as DRF's encoder writes them ("Z" for UTC), int keys allowed
+    OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson, with the same output
+
+    Datetimes, dates, times, UUIDs and the nested answers are encoded natively;
+    any other type (Decimal, lazy translations, querysets) goes through the
+    default hook of DRF's encoder. Indented output and the non-default
+    COMPACT_JSON / UNICODE_JSON settings fall back to the stdlib renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        ret = orjson.dumps(data, default=default, option=OPTIONS)
+        # U+2028 and U+2029 are escaped like DRF does (valid javascript)
+        if b"\xe2\x80" in ret:
+            ret = ret.replace("\u2028".encode(), b"\\u2028")
+            ret = ret.replace("\u2029".encode(), b"\\u2029")
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser backed by orjson (UTF-8 bodies only)"""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -16,6 +16,8 @@ class ErrorMsg:
     CANCELLED: str = "this activity was cancelled"
     EMPTY_REQUEST: str = "no request data received"
     NOT_ALLOWED: str = "method not allowed"
+    FILTER_REQUIRED: str = "at least one filter is required"
+    PROPERTY_INACTIVE: str = "the property is not active"
 
 
 @dataclass(frozen=True)
@@ -23,6 +25,7 @@ class SuccessMsg:
     CREATED: str = "created"
     CANCELLED: str = "cancelled"
     RESCHEDULE: str = "reschedule"
+    DISABLED: str = "disabled"
 
 
 @dataclass(frozen=True)
@@ -1,6 +1,11 @@
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from .models import Property, Activity, Survey
-from datetime import timedelta
+from .export import format_datetime
+from .identity import get_object
 from django.utils.timezone import now
 from django.utils.timezone import datetime
 from django.utils.timezone import make_aware
@@ -9,7 +14,210 @@ from django.utils.timezone import get_current_timezone
 # from icecream import ic
 
 
-class PropertySerializer(serializers.ModelSerializer):
+def survey_url(context, activity_id, archived=False):
+    """Build the absolute survey url, resolving the site domain once per context
+
+    Args:
+        context (dict): Serializer context (shared by every row of a list)
+        activity_id (int): Activity the survey belongs to
+        archived (bool, optional): Archived activity (?include_archived=1 added)
+
+    Returns:
+        str: <domain>/api/activities/<activity_id>/survey/
+    """
+    from django.contrib.sites.shortcuts import get_current_site
+
+    if (domain := context.get("domain")) is None:
+        domain = context["domain"] = get_current_site(context.get("request")).domain
+    url = f"{domain}/api/activities/{activity_id}/survey/"
+    return f"{url}?include_archived=1" if archived else url
+
+
+def check_schedule(property_id, schedule, exclude_pk=None):
+    """Validate that no active activity of the property could cross the schedule
+
+    The colliding activities are fetched with a single query. Call it inside
+    the transaction that writes the schedule, after Property.lock_schedule().
+
+    Raises:
+        ValidationError: There is an activity one hour before or after
+    """
+    acitivities = list(
+        Activity.objects.overlapping(property_id, schedule, exclude_pk).values_list(
+            "id", "property_id", "schedule", "title", "status", "condition"
+        )
+    )
+    if acitivities:
+        raise schedule_conflict(acitivities[0][2], acitivities)
+
+
+def sweep_schedules(schedules, existing):
+    """Find the schedules that could cross an existing or an earlier one
+
+    Sort-and-sweep over the new schedules of a single property: each one is
+    compared with its neighbours in the (sorted) existing schedules and with
+    the last accepted new schedule, following the same +/- one hour rule.
+
+    Args:
+        schedules (list): (key, schedule) pairs to add
+        existing (list): Sorted schedules of the active activities in range
+
+    Returns:
+        dict: key -> schedule it collides with, for the rejected pairs
+    """
+    hour = timedelta(hours=1)
+    conflicts = {}
+    accepted = None
+    for key, schedule in sorted(schedules, key=lambda pair: pair[1]):
+        i = bisect_left(existing, schedule - hour)
+        if i < len(existing) and existing[i] <= schedule + hour:
+            conflicts[key] = existing[i]
+        elif accepted is not None and schedule - accepted <= hour:
+            conflicts[key] = accepted
+        else:
+            accepted = schedule
+    return conflicts
+
+
+def is_overlap(error):
+    """Whether an IntegrityError comes from the activity_no_overlap constraint"""
+    return "activity_no_overlap" in str(error)
+
+
+def schedule_conflict(schedule, acitivities=()):
+    return serializers.ValidationError(
+        {
+            "error": (
+                f"There is an activity scheduled at"
+                f"{schedule} and it could cross. "
+                "Remember that activities can last up to an hour."
+            ),
+            "acitivities": acitivities,
+        }
+    )
+
+
+class IdentityPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField resolved through the request identity map"""
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        queryset = self.get_queryset()
+        try:
+            instance = get_object(queryset.model, queryset=queryset, pk=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if instance is None:
+            self.fail("does_not_exist", pk_value=data)
+        return instance
+
+
+class SparseFieldsMixin:
+    """Serializer limited to the fieldset of the context (see sparse_fieldset)
+
+    ``expandable`` relations are nested, or ids when a fieldset is requested
+    without expanding them.
+    """
+
+    expandable = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, collapsed = self.sparse_fields(self.context)
+        for name in set(self.fields) - set(fields):
+            self.fields.pop(name)
+        for name in collapsed:
+            self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    @classmethod
+    def sparse_fields(cls, context=None):
+        """
+        Returns:
+            tuple: (fields to output, relations rendered as ids)
+        """
+        if not context or context.get("fields") is None:
+            return cls.Meta.fields, ()
+        fields, expand = context["fields"], context.get("expand", ())
+        return fields, tuple(
+            name for name in cls.expandable if name in fields and name not in expand
+        )
+
+    @classmethod
+    def only(cls, queryset, context=None, required=()):
+        """Defer the columns of the fields left out of the fieldset
+
+        Args:
+            queryset (QuerySet): Queryset of Meta.model
+            context (dict, optional): Serializer context
+            required (tuple, optional): Columns always loaded (e.g. updated_at)
+        """
+        if not context or context.get("fields") is None:
+            return queryset
+        columns = {field.name for field in queryset.model._meta.concrete_fields}
+        fields, _ = cls.sparse_fields(context)
+        return queryset.only(
+            *(name for name in (*fields, *required) if name in columns)
+        )
+
+
+class ValuesSerializerMixin(SparseFieldsMixin):
+    """Read-only fast path for lists
+
+    The rows are read with values() and turned into the same dicts the
+    serializer produces, without binding fields and calling to_representation
+    once per row and field. ``values_columns`` are the values() columns and
+    ``datetime_fields`` the ones formatted like DateTimeField. Only the
+    columns of the fieldset (plus the required ones) are read.
+    """
+
+    values_columns = ()
+    datetime_fields = ()
+
+    @classmethod
+    def values(cls, queryset, context=None, required=()):
+        """values() queryset with the columns needed by from_values
+
+        Args:
+            queryset (QuerySet): Queryset of Meta.model
+            context (dict, optional): Serializer context (fieldset)
+            required (tuple, optional): Columns always read (e.g. the
+                pagination key)
+        """
+        fields, _ = cls.sparse_fields(context)
+        columns = [
+            column
+            for column in cls.values_columns
+            if column in fields or column in required
+        ]
+        # Annotations of the pagination key (e.g. the search rank)
+        columns += [column for column in required if column not in cls.values_columns]
+        return queryset.values(*columns)
+
+    @classmethod
+    def from_values(cls, rows, context=None):
+        """Serialized data of the rows read with values()
+
+        Args:
+            rows (iterable): Rows from values()
+            context (dict, optional): Serializer context
+
+        Returns:
+            list: Same output as the serializer with many=True
+        """
+        fields, _ = cls.sparse_fields(context)
+        return [
+            {
+                field: format_datetime(row[field])
+                if field in cls.datetime_fields
+                else row[field]
+                for field in fields
+            }
+            for row in rows
+        ]
+
+
+class PropertySerializer(ValuesSerializerMixin, serializers.ModelSerializer):
     VALID_STATUS = {"Active", "Inactive", "Removed"}
 
     class Meta:
@@ -25,6 +233,9 @@ class PropertySerializer(serializers.ModelSerializer):
             "status",
         )
 
+    values_columns = Meta.fields
+    datetime_fields = ("created_at", "updated_at", "disabled_at")
+
     def validate_status(self, status):
         if status not in self.VALID_STATUS:
             raise serializers.ValidationError(
@@ -36,17 +247,22 @@ class PropertySerializer(serializers.ModelSerializer):
         return status
 
 
-class SurveySerializer(serializers.ModelSerializer):
+class SurveySerializer(ValuesSerializerMixin, serializers.ModelSerializer):
+    serializer_related_field = IdentityPrimaryKeyRelatedField
+
     class Meta:
         model = Survey
         fields = ("id", "answers", "created_at", "activity")
 
+    values_columns = Meta.fields
+    datetime_fields = ("created_at",)
+
     # def validate(self, data):
     #     data['activity_id'] = self.initial_data.get('activity_id')
     #     return data
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(ValuesSerializerMixin, serializers.ModelSerializer):
     class PropertySerializer_(serializers.ModelSerializer):
         class Meta:
             model = Property
@@ -74,6 +290,67 @@ class ActivitySerializer(serializers.ModelSerializer):
             "survey",
         )
 
+    expandable = ("property",)
+    values_columns = (
+        "id",
+        "property",
+        "schedule",
+        "title",
+        "created_at",
+        "updated_at",
+        "status",
+        "condition",
+    )
+    relation_columns = {
+        "property": ("property__title", "property__address"),  # Nested property
+        "survey": ("has_survey",),  # Activity.objects.for_listing()
+    }
+
+    @classmethod
+    def values(cls, queryset, context=None, required=()):
+        fields, collapsed = cls.sparse_fields(context)
+        columns = [
+            column
+            for column in cls.values_columns
+            if column in fields or column in required
+        ]
+        for field, related in cls.relation_columns.items():
+            if field in fields and field not in collapsed:
+                columns += related
+        if "condition" in fields and "live_condition" in queryset.query.annotations:
+            columns.append("live_condition")
+        if "survey" in fields and "archived" in queryset.query.annotations:
+            columns.append("archived")
+        return queryset.values(*columns)
+
+    @classmethod
+    def from_values(cls, rows, context=None):
+        context = {} if context is None else context
+        fields, collapsed = cls.sparse_fields(context)
+        represent = {
+            "id": lambda row: row["id"],
+            "property": lambda row: {
+                "id": row["property"],
+                "title": row["property__title"],
+                "address": row["property__address"],
+            }
+            if row["property"] is not None
+            else None,
+            "schedule": lambda row: format_datetime(row["schedule"]),
+            "title": lambda row: row["title"],
+            "created_at": lambda row: format_datetime(row["created_at"]),
+            "updated_at": lambda row: format_datetime(row["updated_at"]),
+            "status": lambda row: row["status"],
+            "condition": lambda row: row.get("live_condition") or row["condition"],
+            "survey": lambda row: survey_url(context, row["id"], row.get("archived"))
+            if row["has_survey"]
+            else None,
+        }
+        if "property" in collapsed:
+            represent["property"] = lambda row: row["property"]
+        fields = [(field, represent[field]) for field in fields]
+        return [{field: value(row) for field, value in fields} for row in rows]
+
     def get_survey(self, obj):
         """Generate survey url linked to the current activity
 
@@ -83,13 +360,12 @@ class ActivitySerializer(serializers.ModelSerializer):
         Returns:
             Activity: Absolute url of the survey (/api/activity/<activity_id>/survey/)
         """
-        from django.contrib.sites.shortcuts import get_current_site
-
-        request = self.context.get("request")
-        domain = get_current_site(request).domain
-        survey = Survey.objects.filter(activity_id=obj.pk).first()
-        if survey:
-            return f"{domain}/api/activities/{obj.pk}/survey/"  # Absolute
+        has_survey = getattr(obj, "has_survey", None)
+        if has_survey is None:  # Not annotated (e.g. a freshly created instance)
+            has_survey = get_object(Survey, activity_id=obj.pk) is not None
+        if has_survey:
+            archived = getattr(obj, "archived", False)
+            return survey_url(self.context, obj.pk, archived)  # Absolute
         return None
         # return f'{request.get_full_path()}survey/'  # Relative
 
@@ -106,31 +382,18 @@ class ActivitySerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {"error": "schedule date time must be greater than now"}
             )
-        acitivities = (
-            Activity.objects.exclude(status="cancelled")
-            .filter(property=self.instance.property)
-            .filter(
-                schedule__range=(
-                    schedule - timedelta(hours=1),
-                    schedule + timedelta(hours=1),
-                )
-            )
-        )
-        if acitivities:
-            raise serializers.ValidationError(
-                {
-                    "error": (
-                        f"There is an activity scheduled at"
-                        f"{acitivities[0].schedule} and it could cross. "
-                        "Remember that activities can last up to an hour."
-                    ),
-                    "acitivities": acitivities.values_list(),
-                }
-            )
-        self.instance.schedule = schedule
-        self.instance.updated_at = now()
-        self.instance.condition = "Pending"
-        self.instance.save()
+        with transaction.atomic():
+            Property.objects.filter(
+                pk=self.instance.property_id
+            ).lock_schedule().first()
+            check_schedule(self.instance.property_id, schedule, self.instance.pk)
+            self.instance.schedule = schedule
+            self.instance.updated_at = now()
+            self.instance.condition = "Pending"
+            try:
+                self.instance.save()
+            except IntegrityError as e:
+                raise schedule_conflict(schedule) if is_overlap(e) else e
 
     def validate_updated_at(self, updated_at):
         if updated_at:
@@ -176,31 +439,28 @@ class ActivitySerializer(serializers.ModelSerializer):
         except Exception as e:
             print(e)
             raise serializers.ValidationError({"error": "DateTime format error"})
-        acitivities = (
-            Activity.objects.exclude(status="cancelled")
-            .filter(property=property_)
-            .filter(
-                schedule__range=(
-                    schedule - timedelta(hours=1),
-                    schedule + timedelta(hours=1),
-                )
-            )
-        )
-        if acitivities:
-            raise serializers.ValidationError(
-                {
-                    "error": (
-                        f"There is an activity scheduled at"
-                        f"{acitivities[0].schedule} and it could cross. "
-                        "Remember that activities can last up to an hour."
-                    ),
-                    "acitivities": acitivities.values_list(),
-                }
-            )
+        data["schedule"] = schedule = make_aware(schedule, get_current_timezone())
+        if not self.context.get("bulk"):  # Bulk creation checks the whole batch
+            check_schedule(property_.pk, schedule)
 
-        if make_aware(schedule, get_current_timezone()) > now():  # Add condition
+        if schedule > now():  # Add condition
             data["condition"] = "Pending"
         else:
             data["condition"] = "Overdue"
 
         return data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if (condition := getattr(instance, "live_condition", None)) is not None:
+            data["condition"] = condition  # Computed condition mode
+        return data
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError as e:
+            raise schedule_conflict(validated_data.get("schedule")) if is_overlap(
+                e
+            ) else e
@@ -0,0 +1,38 @@
+from .middleware import server_timing
+
+
+class QueryBudgetMixin:
+    """Assertions on the queries counted by TimingMiddleware for a request"""
+
+    def assertQueryBudget(
+        self, method, path, queries, duplicates=0, client=None, **kwargs
+    ):
+        """Request an endpoint and check its number of queries
+
+        Args:
+            method (str): "get", "post", ...
+            path (str): Url of the endpoint
+            queries (int): Maximum number of queries
+            duplicates (int, optional): Maximum number of repeated identical queries
+            client (APIClient, optional): Client, self.client by default
+            kwargs: Passed to the client (data, format, HTTP_* headers)
+
+        Returns:
+            Response: The response, for further assertions
+        """
+        response = getattr(client or self.client, method)(path, **kwargs)
+        timings = response.timings
+        executed = "\n".join(sql for sql, _, _ in timings.queries)
+        self.assertLessEqual(
+            len(timings.queries),
+            queries,
+            f"{method.upper()} {path} ran {len(timings.queries)} queries "
+            f"(budget {queries}):\n{executed}\n{server_timing(timings.metrics())}",
+        )
+        repeated = timings.duplicates()
+        self.assertLessEqual(
+            sum(repeated.values()),
+            duplicates,
+            f"{method.upper()} {path} repeated queries: {repeated}",
+        )
+        return response
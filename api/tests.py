@@ -1,17 +1,56 @@
-from django.test import TestCase
+import csv
+from base64 import urlsafe_b64encode
+import json
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from icecream import ic
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
 
 # from rest_framework.authtoken.models import Token
 # from rest_framework.test import force_authenticate
 from faker import Faker
 from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, connections, transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from django.utils.timezone import now
+from .models import Property, Activity, Survey, SurveyAnswerCount
+from .models import ArchivedActivity, ArchivedSurvey
+from .aggregates import rebuild_answer_counts
+from .serializers import check_schedule
+from .serializers import ActivitySerializer, PropertySerializer, SurveySerializer
 from .responses import StatusMsg, SuccessMsg, ErrorMsg
+from .cache import get_cache, stats
+from .middleware import RequestTimings
+from .renderers import FastJSONParser, FastJSONRenderer
+from .pool import ConnectionPool, PoolTimeout, pool_stats
+from .testing import QueryBudgetMixin
+from .management.commands.benchmark import ROUTES, percentile
+from .conditional import list_validators
+from .dbrouters import PIN_COOKIE, ReplicaRouter
+from .identity import IdentityMap
 from datetime import datetime, timedelta
+import asyncio
+import threading
+import time
+from asgiref.sync import sync_to_async
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()  # Rolled back rows do not bump the cache generations
 
 
-class PropertyTests(TestCase):
+class PropertyTests(APITestCase):
     def setUp(self):
+        super().setUp()
         User.objects.create_superuser("admin", "admin@example.com", "password123")
 
     def test_as_client(self):
@@ -239,3 +278,1785 @@ class PropertyTests(TestCase):
         ic("Read activity (with the survey added)")
         response = client.get("/api/activities/1/")
         self.assertNotEqual(response.data["data"]["survey"], None)  # different to None
+
+
+class ActivityQueryTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        fake = Faker()
+        self.property = Property.objects.create(
+            title=fake.sentence(nb_words=3),
+            address=fake.address(),
+            description=fake.paragraph(nb_sentences=2),
+        )
+        self.client = APIClient()
+
+    def add_activities(self, amount):
+        start = (
+            now() + timedelta(days=365) + timedelta(hours=3 * Activity.objects.count())
+        )
+        for i in range(amount):
+            activity = Activity.objects.create(
+                property=self.property,
+                title=f"activity {i}",
+                schedule=start + timedelta(hours=3 * i),
+            )
+            if i % 2:
+                Survey.objects.create(activity=activity, answers={"q1": "a1"})
+
+    def test_list_queries_do_not_depend_on_rows(self):
+        ic("List activities runs the same queries for 1 or 20 rows")
+        self.add_activities(1)
+        with self.assertNumQueries(2):  # count + rows
+            response = self.client.get("/api/activities/?status=all")
+        self.assertEqual(response.data.get("count"), 1)
+
+        self.add_activities(19)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/activities/?status=all")
+        self.assertEqual(response.data.get("count"), 20)
+        surveys = [row["survey"] for row in response.data["data"]]
+        self.assertEqual(len([url for url in surveys if url]), Survey.objects.count())
+        self.assertTrue(all(row["property"]["id"] for row in response.data["data"]))
+
+    def test_retrieve_queries(self):
+        ic("Retrieve activity loads property and survey flag in one query")
+        self.add_activities(2)
+        activity = Activity.objects.filter(survey__isnull=False).first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/activities/{activity.pk}/")
+        self.assertEqual(
+            response.data["data"]["survey"],
+            f"testserver/api/activities/{activity.pk}/survey/",
+        )
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        fake = Faker()
+        created_at = now()
+        for i in range(5):  # Same created_at, the id breaks the ties
+            Property.objects.create(
+                title=fake.sentence(nb_words=3),
+                address=fake.address(),
+                description=fake.paragraph(nb_sentences=2),
+                created_at=created_at if i < 3 else created_at + timedelta(hours=i),
+            )
+        self.client = APIClient()
+
+    def test_keyset_pages(self):
+        ic("Walk the properties two by two")
+        path = "/api/properties/?page_size=2"
+        ids, pages = [], 0
+        response = self.client.get(f"{path}&count=1")
+        self.assertEqual(response.data.get("count"), 5)
+        while True:
+            pages += 1
+            self.assertContains(response, StatusMsg.OK)
+            ids += [row["id"] for row in response.data["data"]]
+            if not (cursor := response.data["next"]):
+                break
+            response = self.client.get(f"{path}&cursor={cursor}")
+            self.assertNotIn("count", response.data)  # Only computed on demand
+        self.assertEqual(pages, 3)
+        self.assertEqual(
+            ids,
+            list(
+                Property.objects.order_by("created_at", "id").values_list(
+                    "id", flat=True
+                )
+            ),
+        )
+
+    def test_invalid_params(self):
+        ic("Invalid cursor and page size")
+        response = self.client.get("/api/properties/?cursor=nope")
+        self.assertContains(response, "invalid value for (cursor)", status_code=400)
+        response = self.client.get("/api/surveys/?page_size=0")
+        self.assertContains(response, "invalid value for (page_size)", status_code=400)
+
+    def test_tampered_cursor(self):
+        ic("Decodable cursors with values that do not fit the key")
+        for values in (
+            ["garbage", 1],
+            [{"a": 1}, 1],
+            [now().isoformat(), "x"],
+            [None, None],
+        ):
+            cursor = urlsafe_b64encode(json.dumps(values).encode()).decode()
+            for path in (
+                "/api/properties/",
+                "/api/activities/",
+                "/api/properties/?q=a",
+            ):
+                separator = "&" if "?" in path else "?"
+                response = self.client.get(f"{path}{separator}cursor={cursor}")
+                self.assertContains(
+                    response, "invalid value for (cursor)", status_code=400
+                )
+
+    def test_activities_page_keeps_default_filters(self):
+        ic("Paginated activities still default to the weekly window")
+        property_ = Property.objects.first()
+        Activity.objects.create(property=property_, title="soon", schedule=now())
+        Activity.objects.create(
+            property=property_, title="later", schedule=now() + timedelta(days=30)
+        )
+        response = self.client.get("/api/activities/?page_size=10")
+        self.assertEqual([row["title"] for row in response.data["data"]], ["soon"])
+        self.assertIsNone(response.data["next"])
+
+
+class IndexUsageTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Property.objects.bulk_create(
+            Property(title=f"property {i}", address="address", description="")
+            for i in range(20)
+        )
+        start = now()
+        Activity.objects.bulk_create(
+            Activity(
+                property=property_,
+                title="activity",
+                schedule=start + timedelta(hours=3 * i),
+                status="cancelled" if i % 5 == 0 else "Active",
+            )
+            for property_ in Property.objects.all()
+            for i in range(100)
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("ANALYZE api_property, api_activity, api_survey")
+                cursor.execute("SET enable_seqscan = off")  # Tiny tables
+            else:
+                cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan, plan)
+
+    def test_key_querysets_use_indexes(self):
+        ic("Overlap check, list filters and list orderings use index scans")
+        start = now()
+        self.assertUsesIndex(
+            Activity.objects.exclude(status="cancelled")
+            .filter(property=Property.objects.first())
+            .filter(schedule__range=(start, start + timedelta(hours=2))),
+            "activity_schedule_idx",
+        )
+        self.assertUsesIndex(
+            Activity.objects.filter(
+                status="Active", condition="Pending", schedule__gt=start
+            ),
+            "activity_filters_idx",
+        )
+        self.assertUsesIndex(
+            Activity.objects.filter(
+                schedule__range=(start, start + timedelta(days=7))
+            ).order_by("schedule", "id"),
+            "activity_keyset_idx",
+        )
+        self.assertUsesIndex(
+            Property.objects.order_by("created_at", "id")[:10], "property_created_idx"
+        )
+        self.assertUsesIndex(
+            Property.objects.filter(status="Active").order_by("created_at")[:10],
+            "property_status_idx",
+        )
+        self.assertUsesIndex(
+            Survey.objects.order_by("created_at", "id")[:10], "survey_created_idx"
+        )
+
+
+class ScheduleConflictTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="property", address="address", description="description"
+        )
+        self.schedule = now().replace(second=0, microsecond=0) + timedelta(days=2)
+        self.activity = Activity.objects.create(
+            property=self.property, title="activity", schedule=self.schedule
+        )
+
+    def test_conflict_is_one_query(self):
+        ic("The overlap check runs as a single statement")
+        with self.assertNumQueries(1):
+            with self.assertRaises(serializers.ValidationError) as error:
+                check_schedule(self.property.pk, self.schedule + timedelta(minutes=30))
+        self.assertIn("could cross", str(error.exception.detail["error"]))
+        with self.assertNumQueries(1):
+            check_schedule(self.property.pk, self.schedule + timedelta(minutes=61))
+
+    def test_reschedule_ignores_itself(self):
+        ic("An activity can be moved within its own hour")
+        schedule = self.schedule + timedelta(minutes=30)
+        client = APIClient()
+        client.force_authenticate(
+            user=User.objects.create_superuser("admin", "admin@example.com", "pass")
+        )
+        response = client.patch(
+            f"/api/activities/{self.activity.pk}/",
+            data={"schedule": schedule.strftime("%Y-%m-%dT%H:%M")},
+        )
+        self.assertContains(response, SuccessMsg.RESCHEDULE, status_code=200)
+
+    def test_create_loses_the_race(self):
+        ic("An overlap caught by the constraint is a validation error")
+        client = APIClient()
+        client.force_authenticate(
+            user=User.objects.create_superuser("admin", "admin@example.com", "pass")
+        )
+        overlap = IntegrityError(
+            'conflicting key value violates exclusion constraint "activity_no_overlap"'
+        )
+        with mock.patch("api.serializers.check_schedule"), mock.patch.object(
+            Activity, "save", side_effect=overlap
+        ):
+            response = client.post(
+                "/api/activities/",
+                data={
+                    "property": self.property.pk,
+                    "title": "crossing",
+                    "schedule": self.schedule.strftime("%Y-%m-%dT%H:%M"),
+                },
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["status"], StatusMsg.ERROR)
+        self.assertEqual(response.data["error"], ErrorMsg.VALIDATION)
+        self.assertIn("could cross", str(response.data["log"]["error"]))
+
+    @skipUnless(connection.vendor == "postgresql", "exclusion constraint")
+    def test_database_rejects_overlaps(self):
+        ic("The exclusion constraint rejects writes that skip the check")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Activity.objects.create(
+                property=self.property,
+                title="crossing",
+                schedule=self.schedule + timedelta(minutes=59),
+            )
+        Activity.objects.create(  # Cancelled activities never collide
+            property=self.property,
+            title="cancelled",
+            schedule=self.schedule,
+            status="cancelled",
+        )
+
+
+class BulkActivityTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.active = Property.objects.create(
+            title="active", address="address", description="description"
+        )
+        self.inactive = Property.objects.create(
+            title="inactive", address="address", description="", status="Inactive"
+        )
+        self.start = now().replace(second=0, microsecond=0) + timedelta(days=3)
+        Activity.objects.create(
+            property=self.active, title="existing", schedule=self.start
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            user=User.objects.create_superuser("admin", "admin@example.com", "pass")
+        )
+
+    def item(self, property_, hours, title="bulk"):
+        schedule = self.start + timedelta(hours=hours)
+        return {
+            "property": property_.pk,
+            "title": title,
+            "schedule": schedule.strftime("%Y-%m-%dT%H:%M"),
+        }
+
+    def test_bulk_create(self):
+        ic("Bulk create reports the result of every item")
+        items = [
+            self.item(self.active, 2),
+            self.item(self.active, 2.5),  # Crosses the previous item
+            self.item(self.active, 0.5),  # Crosses the existing activity
+            self.item(self.inactive, 2),
+            dict(self.item(self.active, 10), schedule="tomorrow"),
+            self.item(self.active, 4),
+        ]
+        response = self.client.post("/api/activities/", data=items, format="json")
+        self.assertContains(response, SuccessMsg.CREATED, status_code=201)
+        self.assertEqual(response.data["count"], 2)
+        statuses = [result["status"] for result in response.data["data"]]
+        self.assertEqual(
+            statuses,
+            [StatusMsg.OK] + [StatusMsg.ERROR] * 4 + [StatusMsg.OK],
+        )
+        self.assertIn("could cross", str(response.data["data"][1]["log"]))
+        self.assertIn("could cross", str(response.data["data"][2]["log"]))
+        created = response.data["data"][5]["data"]
+        self.assertEqual(Activity.objects.get(pk=created["id"]).title, "bulk")
+        self.assertEqual(created["property"]["id"], self.active.pk)
+        self.assertEqual(Activity.objects.count(), 3)
+
+    def test_bulk_create_all_rejected(self):
+        ic("Bulk create without any valid item is a validation error")
+        items = [
+            self.item(self.active, 0.5),  # Crosses the existing activity
+            self.item(self.inactive, 2),
+            "not an object",
+        ]
+        response = self.client.post("/api/activities/", data=items, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["status"], StatusMsg.ERROR)
+        self.assertEqual(response.data["error"], ErrorMsg.VALIDATION)
+        self.assertNotIn("msg", response.data)
+        self.assertEqual(response.data["count"], 0)
+        self.assertEqual(
+            [result["status"] for result in response.data["data"]],
+            [StatusMsg.ERROR] * 3,
+        )
+        self.assertEqual(Activity.objects.count(), 1)
+
+    def test_bulk_queries_do_not_depend_on_items(self):
+        ic("Bulk create queries depend on the properties, not on the items")
+
+        def post(items):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    "/api/activities/", data=items, format="json"
+                )
+            self.assertEqual(response.data["count"], len(items))
+            return len(queries)
+
+        few = post([self.item(self.active, 10 + 2 * i) for i in range(3)])
+        many = post([self.item(self.active, 100 + 2 * i) for i in range(60)])
+        self.assertEqual(few, many)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        property_ = Property.objects.create(
+            title="property", address="address", description="description"
+        )
+        start = now() + timedelta(days=1)
+        for i in range(3):
+            activity = Activity.objects.create(
+                property=property_,
+                title=f"activity {i}",
+                schedule=start + timedelta(hours=2 * i),
+            )
+            Survey.objects.create(
+                activity=activity, answers={"q1": f"a{i}", "roof": {"state": "poor"}}
+            )
+        Activity.objects.create(
+            property=property_, title="later", schedule=start + timedelta(days=30)
+        )
+        self.client = APIClient()
+
+    def test_ndjson(self):
+        ic("Export activities as NDJSON with the list filters")
+        response = self.client.get("/api/activities/export/")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [row["title"] for row in rows], [f"activity {i}" for i in range(3)]
+        )
+
+        response = self.client.get("/api/activities/export/?status=all&output=ndjson")
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 4)
+
+    def test_csv_flattens_answers(self):
+        ic("Export surveys as CSV with one column per answer")
+        response = self.client.get("/api/surveys/export/?output=csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = list(csv.DictReader(lines))
+        self.assertEqual(
+            list(rows[0]),
+            ["id", "activity", "created_at", "answers.q1", "answers.roof.state"],
+        )
+        self.assertEqual([row["answers.q1"] for row in rows], ["a0", "a1", "a2"])
+
+    def test_invalid_output(self):
+        response = self.client.get("/api/activities/export/?output=xml")
+        self.assertContains(response, "invalid value for (output)", status_code=400)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="property", address="address", description="description"
+        )
+        self.activity = Activity.objects.create(
+            property=self.property, title="activity", schedule=now() + timedelta(days=1)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            user=User.objects.create_superuser("admin", "admin@example.com", "pass")
+        )
+
+    def check_cache(self):
+        response = self.client.get("/api/properties/?status=Active")
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/properties/?status=Active")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["count"], 1)
+
+        ic("A write bumps the generation: the next read is a miss")
+        Property.objects.create(title="new", address="address", description="")
+        response = self.client.get("/api/properties/?status=Active")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["count"], 2)
+
+        ic("Cancel and reschedule invalidate the activity list and detail")
+        path = f"/api/activities/{self.activity.pk}/"
+        self.client.get(path)
+        self.assertEqual(self.client.get(path)["X-Cache"], "HIT")
+        self.client.delete(path)
+        response = self.client.get(path)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["data"]["status"], "cancelled")
+
+        ic("Surveys invalidate the activity survey url")
+        activity = Activity.objects.create(
+            property=self.property, title="other", schedule=now() + timedelta(days=2)
+        )
+        path = f"/api/activities/{activity.pk}/"
+        self.assertIsNone(self.client.get(path).data["data"]["survey"])
+        self.client.post(
+            f"{path}survey/", data={"answers": {"q1": "a1"}}, format="json"
+        )
+        self.assertIsNotNone(self.client.get(path).data["data"]["survey"])
+        self.assertEqual(stats()["hits"], 2)
+
+    def test_local_memory_cache(self):
+        ic("Response cache with the local-memory backend")
+        self.check_cache()
+
+    def test_file_cache(self):
+        ic("Response cache with the file backend")
+        with tempfile.TemporaryDirectory() as location:
+            backend = "django.core.cache.backends.filebased.FileBasedCache"
+            with self.settings(
+                CACHES={"default": {"BACKEND": backend, "LOCATION": location}}
+            ):
+                self.check_cache()
+
+
+class ConditionalRequestTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="property", address="address", description="description"
+        )
+        self.activity = Activity.objects.create(
+            property=self.property, title="activity", schedule=now() + timedelta(days=1)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            user=User.objects.create_superuser("admin", "admin@example.com", "pass")
+        )
+
+    def test_per_row_timestamps(self):
+        ic("created_at/updated_at default to the creation time of each row")
+        other = Property.objects.create(title="other", address="", description="")
+        self.assertGreater(other.created_at, self.property.created_at)
+        self.assertGreater(other.updated_at, self.property.updated_at)
+
+    def check_conditional(self):
+        path = f"/api/activities/{self.activity.pk}/"
+        response = self.client.get(path)
+        etag = response["ETag"]
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        ic("A survey changes the activity (survey url)")
+        self.client.post(f"{path}survey/", data={"answers": {"q": "a"}}, format="json")
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        ic("Survey retrieve")
+        response = self.client.get(f"{path}survey/")
+        response = self.client.get(
+            f"{path}survey/", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+        ic("Lists: max(updated_at) + rows")
+        path = "/api/activities/?status=all"
+        etag = self.client.get(path)["ETag"]
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.client.delete(f"/api/activities/{self.activity.pk}/")
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"][0]["status"], "cancelled")
+
+        ic("If-Modified-Since")
+        path = f"/api/properties/{self.property.pk}/"
+        last_modified = self.client.get(path)["Last-Modified"]
+        response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_conditional_get(self):
+        with self.settings(API_CACHE_ENABLED=False):
+            self.check_conditional()
+
+    def test_conditional_get_from_cache(self):
+        self.check_conditional()
+
+    def test_not_modified_skips_serialization(self):
+        ic("A 304 on a list costs the aggregate query only")
+        with self.settings(API_CACHE_ENABLED=False):
+            path = "/api/properties/"
+            etag = self.client.get(path)["ETag"]
+            with self.assertNumQueries(1):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_paginated_etag(self):
+        ic("Pages get their own validators")
+        path = "/api/activities/?status=all&page_size=1"
+        etag = self.client.get(path)["ETag"]
+        with self.assertNumQueries(0):  # From the cache
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.settings(API_CACHE_ENABLED=False), self.assertNumQueries(1):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class OverdueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        property_ = Property.objects.create(
+            title="property", address="address", description="description"
+        )
+        for hours in (-30, -20, -10, 10):
+            Activity.objects.create(
+                property=property_,
+                title=f"activity {hours}",
+                schedule=now() + timedelta(hours=hours),
+            )
+        self.client = APIClient()
+
+    def conditions(self, condition):
+        response = self.client.get(f"/api/activities/?condition={condition}")
+        return sorted(row["title"] for row in response.data["data"])
+
+    def test_mark_overdue(self):
+        ic("The command moves past-due activities to Overdue in batches")
+        self.assertEqual(self.conditions("Overdue"), [])
+        out = StringIO()
+        with self.assertNumQueries(2 * 2 + 1):  # (select ids + update) * 2 + empty
+            call_command("mark_overdue", batch_size=2, stdout=out)
+        self.assertIn("Done: 3 activities", out.getvalue())
+        self.assertEqual(
+            self.conditions("Overdue"),
+            ["activity -10", "activity -20", "activity -30"],
+        )
+        self.assertEqual(self.conditions("Pending"), ["activity 10"])
+
+    def test_computed_condition(self):
+        ic("The computed mode lists past-due Pending activities as Overdue")
+        with self.settings(API_CONDITION_MODE="computed"):
+            self.assertEqual(
+                self.conditions("Overdue"),
+                ["activity -10", "activity -20", "activity -30"],
+            )
+            response = self.client.get("/api/activities/?status=all")
+            self.assertEqual(
+                sorted(row["condition"] for row in response.data["data"]),
+                ["Overdue", "Overdue", "Overdue", "Pending"],
+            )
+        get_cache().clear()  # The mode is a deployment setting, not part of the key
+        self.assertEqual(self.conditions("Overdue"), [])  # Stored mode
+
+    def test_computed_condition_validators(self):
+        ic("Computed mode: validators change once a schedule passes, without writes")
+        activity = Activity.objects.get(title="activity 10")
+        paths = (
+            f"/api/activities/{activity.pk}/",
+            "/api/activities/?status=all",
+            "/api/activities/?status=all&page_size=10",
+        )
+        later = now() + timedelta(hours=11)
+        with self.settings(API_CONDITION_MODE="computed", API_CACHE_ENABLED=False):
+            etags = {path: self.client.get(path)["ETag"] for path in paths}
+            for path in paths:
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etags[path])
+                self.assertEqual(response.status_code, 304, path)
+            with mock.patch("api.models.now", lambda: later), mock.patch(
+                "api.conditional.now", lambda: later
+            ):
+                for path in paths:
+                    response = self.client.get(path, HTTP_IF_NONE_MATCH=etags[path])
+                    self.assertEqual(response.status_code, 200, path)
+                    self.assertIn("Overdue", json.dumps(response.data["data"]))
+                    self.assertNotIn("Pending", json.dumps(response.data["data"]))
+
+        ic("Cache entries expire at the next schedule")
+        soon = Activity.objects.create(
+            property=activity.property,
+            title="soon",
+            schedule=now() + timedelta(seconds=60),
+        )
+        paths = (f"/api/activities/{soon.pk}/", *paths[1:])
+        cache = get_cache()
+        with self.settings(API_CONDITION_MODE="computed"), mock.patch.object(
+            cache, "set", wraps=cache.set
+        ) as cache_set:
+            for path in paths:
+                self.assertEqual(self.client.get(path)["X-Cache"], "MISS")
+            timeouts = [call.args[2] for call in cache_set.call_args_list]
+            self.assertEqual(len(timeouts), len(paths))
+            self.assertTrue(all(timeout <= 60 for timeout in timeouts), timeouts)
+
+            ic("Lists filtered by the computed condition are not cached")
+            cache_set.reset_mock()
+            for _ in range(2):
+                response = self.client.get("/api/activities/?condition=Pending")
+                self.assertEqual(response["X-Cache"], "MISS")
+            cache_set.assert_not_called()
+
+
+class BenchmarkTests(TransactionTestCase):
+    """Real transactions: the async routes query from the pool threads"""
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_seed_and_benchmark(self):
+        ic("seed inserts the requested volumes and benchmark reports every route")
+        out = StringIO()
+        call_command(
+            "seed",
+            properties=5,
+            activities=40,
+            surveys=10,
+            batch_size=7,
+            stdout=out,
+        )
+        self.assertEqual(Property.objects.count(), 5)
+        self.assertEqual(Activity.objects.count(), 40)
+        self.assertEqual(Survey.objects.count(), 10)
+
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark",
+                requests=3,
+                warmup=1,
+                output=output.name,
+                stdout=out,
+            )
+            report = json.load(output)
+        ic(report["meta"])
+        self.assertEqual(report["meta"]["rows"]["activities"], 40)
+        for name, route in report["routes"].items():
+            self.assertIn(route["status"], (200, 201, 204), name)
+            self.assertLessEqual(route["p50_ms"], route["p99_ms"])
+            self.assertGreater(route["queries"], 0, name)
+        self.assertEqual(set(report["routes"]), {route[0] for route in ROUTES})
+
+    def test_percentile(self):
+        ic("Nearest-rank percentiles")
+        values = list(range(1, 11))
+        self.assertEqual(percentile(values, 50), 5)
+        self.assertEqual(percentile(values, 95), 10)
+        self.assertEqual(percentile([1, 2], 50), 1)
+        self.assertEqual(percentile([1, 2, 3, 4], 25), 1)
+        self.assertIsNone(percentile([], 50))
+
+
+class TimingTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        property_ = Property.objects.create(
+            title="Timed", address="Somewhere", description="-", status="Active"
+        )
+        for hours in (2, 4, 6):
+            Activity.objects.create(
+                property=property_,
+                title=f"activity {hours}",
+                schedule=now() + timedelta(hours=hours),
+            )
+        self.activity = Activity.objects.first()
+        Survey.objects.create(activity=self.activity, answers={"rating": 5})
+        self.client = APIClient()
+
+    def test_server_timing(self):
+        ic("Every response carries its query count and timings")
+        response = self.client.get("/api/activities/")
+        header = response["Server-Timing"]
+        ic(header)
+        for metric in ("db;", "serialize;", "render;", "view;", "total;"):
+            self.assertIn(metric, header)
+        self.assertIn(f'desc="{len(response.timings.queries)} queries"', header)
+        self.assertNotIn("dup;", header)
+
+    def test_duplicated_queries(self):
+        ic("Identical queries are flagged")
+        timings = RequestTimings()
+        with connection.execute_wrapper(timings):
+            for _ in range(2):
+                Survey.objects.filter(activity_id=self.activity.pk).exists()
+            Survey.objects.filter(activity_id=0).exists()
+        self.assertEqual(list(timings.duplicates().values()), [2])
+        self.assertIn(("dup", 0, "2 duplicated queries"), timings.metrics())
+
+    def test_query_budgets(self):
+        ic("Per-endpoint query budgets")
+        with self.settings(API_CACHE_ENABLED=False):
+            self.assertQueryBudget("get", "/api/properties/", 2)
+            self.assertQueryBudget("get", "/api/activities/", 2)
+            self.assertQueryBudget("get", "/api/activities/?page_size=2", 1)
+            self.assertQueryBudget("get", f"/api/activities/{self.activity.pk}/", 1)
+            self.assertQueryBudget(
+                "get", f"/api/activities/{self.activity.pk}/survey/", 1
+            )
+        self.client.get("/api/activities/")
+        self.assertQueryBudget("get", "/api/activities/", 0)  # Cached
+
+
+class FastSerializationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        active = Property.objects.create(
+            title="Fast", address="Street 1", description="-", status="Active"
+        )
+        for hours in (-3, 5):
+            Activity.objects.create(
+                property=active,
+                title=f"activity {hours}",
+                schedule=now() + timedelta(hours=hours),
+            )
+        Activity.objects.create(property=None, title="orphan", schedule=now())
+        Property.objects.create(
+            title="Off", address="Street 2", description="-", status="Inactive"
+        )
+        Survey.objects.create(
+            activity=Activity.objects.first(), answers={"rating": 5, "notes": ["a"]}
+        )
+        request = Request(APIRequestFactory().get("/api/activities/"))
+        self.context = {"request": request}
+
+    def assertSameOutput(self, serializer, queryset):
+        render = JSONRenderer().render
+        expected = render(
+            serializer(queryset, many=True, context=dict(self.context)).data
+        )
+        fast = render(
+            serializer.from_values(serializer.values(queryset), dict(self.context))
+        )
+        self.assertEqual(fast, expected)
+
+    def test_byte_identical(self):
+        ic("values() rows serialize exactly like the serializers")
+        self.assertSameOutput(PropertySerializer, Property.objects.order_by("id"))
+        self.assertSameOutput(SurveySerializer, Survey.objects.order_by("id"))
+        self.assertSameOutput(
+            ActivitySerializer, Activity.objects.for_listing().order_by("id")
+        )
+        with self.settings(API_CONDITION_MODE="computed"):
+            self.assertSameOutput(
+                ActivitySerializer, Activity.objects.for_listing().order_by("id")
+            )
+
+    def test_list_uses_values(self):
+        ic("Lists read values() rows")
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/api/activities/?status=all&page_size=2")
+        self.assertEqual(len(response.data["data"]), 2)
+        self.assertIn("survey", response.data["data"][0])
+        self.assertNotIn(
+            '"property"."description"', queries.captured_queries[-1]["sql"]
+        )
+
+
+class RendererTests(APITestCase):
+    def test_same_output(self):
+        ic("orjson renders exactly like DRF's JSONRenderer")
+        from decimal import Decimal
+        from uuid import uuid4
+        from django.utils.translation import gettext_lazy
+        from datetime import timezone as tz
+
+        data = {
+            "status": "OK",
+            "data": [
+                {
+                    "utc": now(),
+                    "offset": datetime(
+                        2021, 5, 1, 10, 30, tzinfo=tz(timedelta(hours=-5))
+                    ),
+                    "naive": datetime(2021, 5, 1, 10, 30, 15, 120),
+                    "date": datetime(2021, 5, 1).date(),
+                    "decimal": Decimal("1.50"),
+                    "uuid": uuid4(),
+                    "lazy": gettext_lazy("Active"),
+                    "text": "dirección \u2028 \u2029 ✓",
+                    "answers": {"rating": 5, "notes": ["a", None, 1.5]},
+                    1: True,
+                }
+            ],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_parser(self):
+        ic("orjson parser")
+        body = b'{"title": "caf\xc3\xa9", "answers": {"rating": 5}}'
+        self.assertEqual(
+            FastJSONParser().parse(BytesIO(body)),
+            {"title": "café", "answers": {"rating": 5}},
+        )
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b"{nope"))
+
+    def test_api_uses_fast_renderer(self):
+        ic("The API renders and parses with the fast pair")
+        client = APIClient()
+        client.force_authenticate(
+            user=User.objects.create_superuser("admin", "admin@example.com", "pw")
+        )
+        response = client.post(
+            "/api/properties/",
+            data={
+                "title": "Json",
+                "address": "-",
+                "description": "-",
+                "status": "Active",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(json.loads(response.content)["data"]["title"], "Json")
+
+    def test_benchmark_json(self):
+        ic("Micro-benchmark of both renderers and parsers")
+        out = StringIO()
+        call_command("seed", properties=2, activities=10, surveys=5, stdout=out)
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_json", rows=10, repeat=2, output=output.name, stdout=out
+            )
+            results = json.load(output)
+        self.assertEqual(sorted(results), ["activities", "surveys"])
+        self.assertEqual(results["surveys"]["rows"], 5)
+
+
+class AsyncViewTests(TransactionTestCase):
+    """Run with real transactions: the pool threads use their own connections"""
+
+    def setUp(self):
+        get_cache().clear()
+        property_ = Property.objects.create(
+            title="Async", address="-", description="-", status="Active"
+        )
+        for hours in (1, 3, 5):
+            Activity.objects.create(
+                property=property_,
+                title=f"activity {hours}",
+                schedule=now() + timedelta(hours=hours),
+            )
+        self.activity = Activity.objects.first()
+        Survey.objects.create(activity=self.activity, answers={"rating": 4})
+        self.paths = [
+            "/api/properties/",
+            f"/api/properties/{property_.pk}/",
+            "/api/activities/",
+            f"/api/activities/{self.activity.pk}/",
+            f"/api/activities/{self.activity.pk}/survey/",
+        ]
+
+    async def test_same_responses(self):
+        ic("Async endpoints answer like the WSGI ones")
+        client, async_client = Client(), AsyncClient()
+        for path in self.paths:
+            expected = await sync_to_async(client.get)(path)
+            response = await async_client.get(path.replace("/api/", "/api/async/"))
+            self.assertEqual(response.status_code, expected.status_code, path)
+            self.assertEqual(response.content, expected.content, path)
+            self.assertIn("db;", response["Server-Timing"])
+
+    async def test_concurrent_load(self):
+        ic("Slow queries overlap on the async path, bounded by the pool")
+        in_flight, peak = [0], [0]
+        lock = threading.Lock()
+        original = list_validators
+
+        def slow_validators(*args, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            try:
+                time.sleep(0.05)  # A slow query
+                return original(*args, **kwargs)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+        requests = 8
+        with self.settings(API_CACHE_ENABLED=False, API_ASYNC_WORKERS=4):
+            with mock.patch("api.views.list_validators", slow_validators):
+                async_client = AsyncClient()
+                responses = await asyncio.gather(
+                    *(
+                        async_client.get("/api/async/activities/")
+                        for _ in range(requests)
+                    )
+                )
+        ic(peak[0])
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertGreater(peak[0], 1)  # The queries overlap
+        self.assertLessEqual(peak[0], 4)  # Never more than API_ASYNC_WORKERS
+
+
+class ConnectionPoolTests(APITestCase):
+    """sqlite3 connections stand in for the PostgreSQL ones"""
+
+    def pool(self, **kwargs):
+        import sqlite3
+
+        return ConnectionPool(
+            lambda: sqlite3.connect(":memory:", check_same_thread=False), **kwargs
+        )
+
+    def test_reuse(self):
+        ic("Released connections are handed out again")
+        pool = self.pool(size=2)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(
+            pool.stats(),
+            dict(
+                checkouts=2,
+                waits=0,
+                timeouts=0,
+                created=1,
+                discarded=0,
+                in_use=1,
+                idle=0,
+            ),
+        )
+
+    def test_overflow_and_timeout(self):
+        ic("Overflow connections are closed on release, checkouts wait and time out")
+        pool = self.pool(size=1, max_overflow=1, timeout=0.05)
+        connections = [pool.acquire(), pool.acquire()]
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+        pool.timeout = 2
+        timer = threading.Timer(0.05, pool.release, args=(connections[1],))
+        timer.start()
+        connections[1] = pool.acquire()  # Waits for the release
+        timer.join()
+        for raw in connections:
+            pool.release(raw)
+        stats = pool.stats()
+        ic(stats)
+        self.assertEqual((stats["waits"], stats["timeouts"]), (2, 1))
+        self.assertEqual((stats["idle"], stats["in_use"]), (1, 0))
+        self.assertEqual(stats["discarded"], 1)
+
+    def test_health_check(self):
+        ic("Broken or old idle connections are replaced")
+        pool = self.pool(check=lambda connection: connection.execute("SELECT 1"))
+        broken = pool.acquire()
+        pool.release(broken)
+        broken.close()
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, broken)
+        self.assertEqual(replacement.execute("SELECT 1").fetchone(), (1,))
+
+        pool.recycle = 0
+        pool.release(replacement)  # Too old to keep
+        self.assertEqual(pool.stats()["idle"], 0)
+        self.assertEqual(pool.stats()["discarded"], 2)
+
+    @skipUnless(
+        connection.settings_dict.get("POOL") is not None, "pooled PostgreSQL backend"
+    )
+    def test_backend(self):
+        ic("The backend returns its connection to the pool when closed")
+        wrapper = connections.create_connection(
+            "default"
+        )  # Outside the test transaction
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+        wrapper.close()
+        self.assertTrue(pool_stats())
+
+
+@override_settings(API_REPLICAS=["replica"], API_CACHE_ENABLED=False)
+class ReplicaRoutingTests(TransactionTestCase):
+    """A second alias of the test database stands in for a replica"""
+
+    databases = "__all__"  # Includes the alias added in setUpClass
+
+    @classmethod
+    def setUpClass(cls):
+        connections.settings["replica"] = dict(connections["default"].settings_dict)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        get_cache().clear()
+        self.property = Property.objects.create(
+            title="Replica", address="-", description="-", status="Active"
+        )
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def get(self, client, path):
+        """Response and the aliases that answered its queries"""
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                response = client.get(path)
+        used = {"default": len(primary), "replica": len(replica)}
+        return response, {alias for alias, queries in used.items() if queries}
+
+    def test_routing(self):
+        ic("GETs read from the replica, writes go to the primary")
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Activity), "default")  # Outside requests
+        self.assertEqual(router.db_for_write(Activity), "default")
+        self.assertFalse(router.allow_migrate("replica", "api"))
+
+        _, aliases = self.get(APIClient(), "/api/properties/")
+        self.assertEqual(aliases, {"replica"})
+
+        writer = APIClient()
+        writer.force_authenticate(user=self.admin)
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = writer.post(
+                "/api/activities/",
+                data={
+                    "property": self.property.pk,
+                    "title": "Written",
+                    "schedule": (now() + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M"),
+                },
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(replica), 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        ic("The writer reads its own writes from the primary")
+        pk = response.data["data"]["id"]
+        response, aliases = self.get(writer, f"/api/activities/{pk}/")
+        self.assertEqual(response.data["data"]["title"], "Written")
+        self.assertEqual(aliases, {"default"})
+
+        _, aliases = self.get(APIClient(), f"/api/activities/{pk}/")
+        self.assertEqual(aliases, {"replica"})
+
+        writer.cookies[PIN_COOKIE] = str(time.time() - 1)  # Pin expired
+        _, aliases = self.get(writer, f"/api/activities/{pk}/")
+        self.assertEqual(aliases, {"replica"})
+
+    def test_cache_fill(self):
+        ic("Only responses read from the primary fill the cache")
+        path = "/api/properties/"
+        reader = APIClient()
+        with self.settings(API_CACHE_ENABLED=True):
+            for _ in range(2):
+                response, aliases = self.get(reader, path)
+                self.assertEqual(response["X-Cache"], "MISS")
+                self.assertEqual(aliases, {"replica"})
+
+            writer = APIClient()
+            writer.cookies[PIN_COOKIE] = str(time.time() + 60)  # Pinned
+            response, aliases = self.get(writer, path)
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertEqual(aliases, {"default"})
+            response, aliases = self.get(reader, path)
+            self.assertEqual(response["X-Cache"], "HIT")
+            self.assertEqual(aliases, set())
+
+
+class SurveyFilterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.properties = [
+            Property.objects.create(
+                title=f"Property {i}", address="-", description="-", status="Active"
+            )
+            for i in range(2)
+        ]
+        answers = [
+            (
+                0,
+                -48,
+                {"roof_condition": "poor", "rating": 2, "roof": {"material": "tile"}},
+            ),
+            (0, -24, {"roof_condition": "good", "rating": 5, "pest_control": "yes"}),
+            (1, -24, {"roof_condition": "poor", "rating": "5", "pest_control": "yes"}),
+            (
+                1,
+                24,
+                {"roof_condition": "fair", "rating": 4, "roof": {"material": "metal"}},
+            ),
+        ]
+        self.surveys = []
+        for index, hours, answer in answers:
+            activity = Activity.objects.create(
+                property=self.properties[index],
+                title=f"activity {index} {hours}",
+                schedule=now() + timedelta(hours=hours),
+            )
+            self.surveys.append(
+                Survey.objects.create(activity=activity, answers=answer)
+            )
+        self.client = APIClient()
+
+    def ids(self, query):
+        response = self.client.get(f"/api/surveys/?{query}")
+        self.assertEqual(response.status_code, 200, response.data)
+        return [
+            self.surveys.index(Survey(pk=row["id"])) for row in response.data["data"]
+        ]
+
+    def test_answer_filters(self):
+        ic("Filters on answer keys and values")
+        self.assertEqual(self.ids("answers.roof_condition=poor"), [0, 2])
+        self.assertEqual(self.ids("answers.rating=5"), [1, 2])  # Number or text
+        self.assertEqual(self.ids("answers.roof.material=metal"), [3])
+        self.assertEqual(self.ids("answers.roof_condition=poor&answers.rating=2"), [0])
+        self.assertEqual(
+            self.ids('answers_contains={"pest_control": "yes", "rating": 5}'), [1]
+        )
+        self.assertEqual(
+            self.ids('answers_contains={"roof": {"material": "tile"}}'), [0]
+        )
+
+    def test_combined_filters(self):
+        ic("Answer filters combine with the property and the schedule")
+        property_ = self.properties[1].pk
+        self.assertEqual(self.ids(f"property={property_}"), [2, 3])
+        self.assertEqual(
+            self.ids(f"property={property_}&answers.pest_control=yes"), [2]
+        )
+        schedule_from = now().strftime("%Y-%m-%dT%H:%M")
+        self.assertEqual(self.ids(f"schedule_from={schedule_from}"), [3])
+        self.assertEqual(self.ids("answers.roof_condition=poor&page_size=1"), [0])
+
+        response = self.client.get("/api/surveys/export/?answers.roof_condition=poor")
+        rows = [json.loads(line) for line in response.streaming_content]
+        self.assertEqual(
+            [row["id"] for row in rows], [self.surveys[0].pk, self.surveys[2].pk]
+        )
+
+    def test_invalid_filters(self):
+        ic("Invalid filters")
+        for query in ("answers_contains=[1]", "answers_contains={nope", "property=x"):
+            response = self.client.get(f"/api/surveys/?{query}")
+            self.assertEqual(response.status_code, 400, query)
+
+    @skipUnless(connection.vendor == "postgresql", "GIN index on answers")
+    def test_containment_query(self):
+        ic("Postgres filters with @> (GIN index)")
+        with CaptureQueriesContext(connection) as queries:
+            self.ids("answers.roof_condition=poor")
+        self.assertIn("@>", queries.captured_queries[-1]["sql"])
+
+
+class SurveyStatsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="Stats", address="-", description="-", status="Active"
+        )
+        self.activities = [
+            Activity.objects.create(
+                property=self.property,
+                title=f"activity {hours}",
+                schedule=now() + timedelta(hours=hours),
+            )
+            for hours in (2, 4, 6)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(
+            user=User.objects.create_superuser("admin", "admin@example.com", "pw")
+        )
+
+    def answer(self, activity, answers):
+        response = self.client.post(
+            f"/api/activities/{activity.pk}/survey/",
+            data={"answers": answers},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def stats(self):
+        response = self.client.get(f"/api/properties/{self.property.pk}/survey-stats/")
+        self.assertEqual(response.status_code, 200)
+        return response.data["data"]["questions"]
+
+    def test_counts_follow_surveys(self):
+        ic("Survey creation updates the answer counts in the same transaction")
+        self.answer(self.activities[0], {"roof_condition": "poor", "rating": 5})
+        self.answer(
+            self.activities[1],
+            {"roof_condition": "poor", "rating": 4, "roof": {"material": "tile"}},
+        )
+        expected = {
+            "rating": {"4": 1, "5": 1},
+            "roof.material": {"tile": 1},
+            "roof_condition": {"poor": 2},
+        }
+        with self.assertNumQueries(1):
+            self.assertEqual(self.stats(), expected)
+
+        ic("The rebuild command gives the same counts")
+        SurveyAnswerCount.objects.update(count=0)
+        out = StringIO()
+        call_command("rebuild_survey_stats", stdout=out)
+        self.assertIn("Done: 4 answer counts", out.getvalue())
+        self.assertEqual(self.stats(), expected)
+
+    def test_empty_and_missing(self):
+        ic("Properties without surveys and unknown properties")
+        self.assertEqual(self.stats(), {})
+        response = self.client.get("/api/properties/0/survey-stats/")
+        self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="Availability", address="-", description="-", status="Active"
+        )
+        self.base = (now() + timedelta(days=1)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        for minutes, status in ((120, "Active"), (270, "Active"), (480, "cancelled")):
+            Activity.objects.create(
+                property=self.property,
+                title=f"activity {minutes}",
+                schedule=self.base + timedelta(minutes=minutes),
+                status=status,
+            )
+        self.client = APIClient()
+
+    def at(self, minutes):
+        return serializers.DateTimeField().to_representation(
+            self.base + timedelta(minutes=minutes)
+        )
+
+    def get(self, query=""):
+        start = self.base.strftime("%Y-%m-%dT%H:%M")
+        end = (self.base + timedelta(hours=10)).strftime("%Y-%m-%dT%H:%M")
+        return self.client.get(
+            f"/api/properties/{self.property.pk}/availability/"
+            f"?from={start}&to={end}{query}"
+        )
+
+    def test_free_and_busy(self):
+        ic("Free schedules follow the one-hour rule, cancelled activities are ignored")
+        with self.assertNumQueries(2):  # Property + schedules
+            response = self.get()
+        data = response.data["data"]
+        self.assertEqual(
+            data["busy"],
+            [
+                {"start": self.at(120), "end": self.at(180)},
+                {"start": self.at(270), "end": self.at(330)},
+            ],
+        )
+        self.assertEqual(
+            data["free"],
+            [
+                {"start": self.at(0), "end": self.at(59)},
+                {"start": self.at(181), "end": self.at(209)},
+                {"start": self.at(331), "end": self.at(600)},
+            ],
+        )
+        ic("The bounds of every free range pass the schedule check")
+        for minutes in (0, 59, 181, 209, 331, 600):
+            check_schedule(self.property.pk, self.base + timedelta(minutes=minutes))
+        for minutes in (60, 180, 210, 330):
+            with self.assertRaises(serializers.ValidationError):
+                check_schedule(self.property.pk, self.base + timedelta(minutes=minutes))
+
+    def test_duration(self):
+        ic("Longer activities need longer gaps")
+        data = self.get("&duration=120").data["data"]
+        self.assertEqual(data["duration"], 120)
+        self.assertEqual(data["free"], [{"start": self.at(331), "end": self.at(600)}])
+
+    def test_invalid(self):
+        ic("Invalid availability params")
+        for query in ("&duration=0", "&duration=x", "&to=2000-01-01T00:00"):
+            self.assertEqual(self.get(query).status_code, 400, query)
+        self.assertEqual(
+            self.client.get("/api/properties/0/availability/").status_code, 400
+        )
+
+    def test_inactive_property(self):
+        ic("Disabled properties have no free schedules")
+        Property.objects.filter(pk=self.property.pk).update(status="Inactive")
+        response = self.get()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], ErrorMsg.PROPERTY_INACTIVE)
+
+
+class IdentityMapTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="Mapped", address="Somewhere", description="-", status="Active"
+        )
+        self.activity = Activity.objects.create(
+            property=self.property,
+            title="activity",
+            schedule=now() + timedelta(hours=3),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+
+    def test_loaded_once(self):
+        ic("Each row is loaded once, misses and relations included")
+        identity_map = IdentityMap()
+        queryset = Activity.objects.select_related("property", "survey")
+        with self.assertNumQueries(1):
+            activity = identity_map.get(Activity, queryset, pk=self.activity.pk)
+            self.assertIs(identity_map.get(Activity, id=self.activity.pk), activity)
+            self.assertIs(
+                identity_map.get(Property, pk=self.property.pk), activity.property
+            )
+            self.assertIsNone(identity_map.get(Survey, activity_id=activity.pk))
+        with self.assertNumQueries(1):
+            self.assertIsNone(identity_map.get(Activity, pk=0))
+            self.assertIsNone(identity_map.get(Activity, pk=0))
+        identity_map.discard(activity)
+        self.assertIsNone(identity_map.get(Activity, pk=self.activity.pk))
+
+    def test_request_budgets(self):
+        ic("Writes and reads of a request share the loaded rows")
+        path = f"/api/activities/{self.activity.pk}/survey/"
+        with self.settings(API_CACHE_ENABLED=False):
+            self.assertQueryBudget("get", path, 1)  # Activity joined with its survey
+            # Activity, unique check, insert, 2 answer counts, touch (+ savepoints)
+            self.assertQueryBudget(
+                "post", path, 8, data={"answers": {"rating": 5}}, format="json"
+            )
+            response = self.assertQueryBudget("get", path, 1)
+            self.assertEqual(response.data["data"]["answers"], {"rating": 5})
+            # Lock, property, overlap check, insert (+ savepoints), no survey lookup
+            response = self.assertQueryBudget(
+                "post",
+                "/api/activities/",
+                8,
+                data={
+                    "property": self.property.pk,
+                    "title": "new",
+                    "schedule": (now() + timedelta(days=2)).strftime("%Y-%m-%dT%H:%M"),
+                },
+            )
+            self.assertIsNone(response.data["data"]["survey"])
+
+    def test_scoped_to_the_request(self):
+        ic("Rows changed by other requests are read again")
+        path = f"/api/activities/{self.activity.pk}/"
+        with self.settings(API_CACHE_ENABLED=False):
+            self.client.get(path)
+            Activity.objects.filter(pk=self.activity.pk).update(title="renamed")
+            self.assertEqual(self.client.get(path).data["data"]["title"], "renamed")
+
+
+class SparseFieldsetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="Sparse",
+            address="Somewhere",
+            description="Long text",
+            status="Active",
+        )
+        for hours in (2, 4):
+            Activity.objects.create(
+                property=self.property,
+                title=f"activity {hours}",
+                schedule=now() + timedelta(hours=hours),
+            )
+        self.activity = Activity.objects.first()
+        Survey.objects.create(activity=self.activity, answers={"rating": 5})
+        self.client = APIClient()
+
+    def executed(self, response):
+        return "\n".join(sql for sql, _, _ in response.timings.queries)
+
+    def test_list_columns(self):
+        ic("Only the requested columns are selected and serialized")
+        fields = "id,title,schedule,condition"
+        for query in ("", "&page_size=1"):
+            response = self.client.get(f"/api/activities/?fields={fields}{query}")
+            self.assertEqual(response.status_code, 200)
+            for row in response.data["data"]:
+                self.assertEqual(list(row), ["id", "schedule", "title", "condition"])
+            sql = self.executed(response)
+            self.assertNotIn("api_survey", sql)
+            self.assertNotIn("api_property", sql)
+        cursor = response.data["next"]
+        response = self.client.get(
+            f"/api/activities/?fields={fields}&page_size=1&cursor={cursor}"
+        )
+        self.assertEqual(response.data["data"][0]["title"], "activity 4")
+
+        response = self.client.get("/api/properties/?fields=title")
+        self.assertEqual(response.data["data"], [{"title": "Sparse"}])
+        self.assertNotIn("description", self.executed(response))
+
+    def test_expand(self):
+        ic("Relations are ids in a fieldset unless expanded")
+        path = f"/api/activities/{self.activity.pk}/?fields=id,property,survey"
+        data = self.client.get(path).data["data"]
+        self.assertEqual(data["property"], self.property.pk)
+        self.assertTrue(data["survey"].endswith(f"/{self.activity.pk}/survey/"))
+        for path in (path, "/api/activities/?fields=id,property"):
+            response = self.client.get(f"{path}&expand=property")
+            data = response.data["data"]
+            data = data if isinstance(data, dict) else data[0]
+            self.assertEqual(
+                data["property"],
+                {"id": self.property.pk, "title": "Sparse", "address": "Somewhere"},
+            )
+
+    def test_detail(self):
+        ic("Detail routes defer the columns left out")
+        with self.settings(API_CACHE_ENABLED=False):
+            response = self.assertQueryBudget(
+                "get", f"/api/activities/{self.activity.pk}/?fields=id,title", 1
+            )
+            self.assertEqual(
+                response.data["data"], {"id": self.activity.pk, "title": "activity 2"}
+            )
+            self.assertNotIn("api_survey", self.executed(response))
+            response = self.client.get(
+                f"/api/properties/{self.property.pk}/?fields=id,status"
+            )
+            self.assertNotIn("description", self.executed(response))
+            self.assertIn("ETag", response)
+        serializer = ActivitySerializer(
+            self.activity, context={"fields": ("id", "property"), "expand": ()}
+        )
+        self.assertEqual(
+            serializer.data, {"id": self.activity.pk, "property": self.property.pk}
+        )
+
+    def test_invalid(self):
+        ic("Unknown fields and relations")
+        for query in ("fields=id,description", "expand=survey", "fields=id&expand=x"):
+            response = self.client.get(f"/api/activities/?{query}")
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(
+            self.client.get("/api/properties/?expand=property").status_code, 400
+        )
+
+
+class PropertySearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.beach = Property.objects.create(
+            title="Beach house",
+            address="12 Ocean Drive",
+            description="Two rooms near the beach",
+            status="Active",
+        )
+        self.garden = Property.objects.create(
+            title="Garden flat",
+            address="3 Beach Road",
+            description="Small garden",
+            status="Inactive",
+        )
+        Property.objects.create(
+            title="Office", address="Main street", description="-", status="Active"
+        )
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get(f"/api/properties/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.data["data"]]
+
+    def test_ranked(self):
+        ic("Words in the title rank first, every word must match")
+        self.assertEqual(self.search("q=beach"), [self.beach.pk, self.garden.pk])
+        self.assertEqual(self.search("q=beaches"), [self.beach.pk, self.garden.pk])
+        self.assertEqual(self.search("q=beach garden"), [self.garden.pk])
+        self.assertEqual(self.search('q="nowhere'), [])
+        self.assertEqual(self.search("q=beach&status=Inactive"), [self.garden.pk])
+
+    def test_updates(self):
+        ic("The search index follows inserts, updates and deletes")
+        self.garden.title = "Garden flat by the sea"
+        self.garden.save()
+        self.assertEqual(self.search("q=sea"), [self.garden.pk])
+        self.garden.delete()
+        self.assertEqual(self.search("q=garden"), [])
+
+    def test_paginated(self):
+        ic("Search results are paginated in rank order")
+        response = self.client.get("/api/properties/?q=beach&page_size=1&count=1")
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(response.data["data"][0]["id"], self.beach.pk)
+        cursor = response.data["next"]
+        response = self.client.get(
+            f"/api/properties/?q=beach&page_size=1&cursor={cursor}"
+        )
+        self.assertEqual(response.data["data"][0]["id"], self.garden.pk)
+        self.assertIsNone(response.data["next"])
+
+
+class AutocompleteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.ocean = Property.objects.create(
+            title="Beach house", address="12 Ocean Drive", description="-"
+        )
+        self.drive = Property.objects.create(
+            title="Flat", address="Oceanside Drive 4", description="-"
+        )
+        Property.objects.create(title="Office", address="Main street", description="-")
+        self.client = APIClient()
+
+    def complete(self, query):
+        response = self.client.get(f"/api/properties/autocomplete/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.data["data"]
+
+    def test_matches(self):
+        ic("Addresses containing the text, the ones starting with it first")
+        data = self.complete("prefix=ocean")
+        self.assertEqual([row["id"] for row in data], [self.drive.pk, self.ocean.pk])
+        self.assertEqual(
+            data[1],
+            {"id": self.ocean.pk, "title": "Beach house", "address": "12 Ocean Drive"},
+        )
+        self.assertEqual(len(self.complete("prefix=drive&limit=1")), 1)
+        self.assertEqual(self.complete("prefix=oc"), [])  # Too short
+        self.assertEqual(self.complete('prefix="xyz'), [])
+
+    def test_index_follows_writes(self):
+        ic("The address index follows updates")
+        self.ocean.address = "1 Harbour Lane"
+        self.ocean.save()
+        self.assertEqual(
+            [row["id"] for row in self.complete("prefix=harb")], [self.ocean.pk]
+        )
+        self.assertEqual(
+            [row["id"] for row in self.complete("prefix=ocean")], [self.drive.pk]
+        )
+
+    def test_limits(self):
+        ic("Hard result limit")
+        for limit in ("0", "11", "x"):
+            response = self.client.get(
+                f"/api/properties/autocomplete/?prefix=ocean&limit={limit}"
+            )
+            self.assertEqual(response.status_code, 400, limit)
+
+
+class BulkCancelTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="Cancel", address="Somewhere", description="-", status="Active"
+        )
+        self.other = Property.objects.create(
+            title="Other", address="Elsewhere", description="-", status="Active"
+        )
+        for property_ in (self.property, self.other):
+            for hours in (-4, 2, 4, 6):
+                Activity.objects.create(
+                    property=property_,
+                    title=f"activity {hours}",
+                    schedule=now() + timedelta(hours=hours),
+                )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+
+    def test_bulk_cancel(self):
+        ic("Activities matching the filters are cancelled with one UPDATE")
+        schedule_to = (now() + timedelta(hours=5)).strftime("%Y-%m-%dT%H:%M")
+        self.client.get("/api/activities/?status=all")  # Cached
+        data = {"property": self.property.pk, "schedule_to": schedule_to}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/activities/cancel/", data)
+        self.assertEqual(response.data["count"], 3)
+        updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            Activity.objects.filter(status="cancelled").count(), 3
+        )  # The other property is untouched
+        self.assertEqual(
+            self.client.post("/api/activities/cancel/", data).data["count"], 0
+        )
+        response = self.client.get("/api/activities/?status=cancelled")
+        self.assertEqual(response.data["count"], 3)  # Not a stale cached list
+
+    def test_bulk_cancel_invalid(self):
+        ic("Bulk cancel needs a valid filter")
+        invalid = (
+            {},
+            {"status": "all"},
+            {"status": "all", "condition": "all"},
+            {"property": "x"},
+            {"schedule_to": "tomorrow"},
+        )
+        for data in invalid:
+            response = self.client.post("/api/activities/cancel/", data)
+            self.assertEqual(response.status_code, 400, data)
+        for data in ([1, 2], "status"):  # Not an object
+            response = self.client.post("/api/activities/cancel/", data, format="json")
+            self.assertEqual(response.status_code, 400, data)
+            self.assertEqual(response.data["error"], ErrorMsg.VALIDATION)
+        self.assertFalse(Activity.objects.filter(status="cancelled").exists())
+
+    def test_disable(self):
+        ic("Disabling a property cancels its future activities")
+        path = f"/api/properties/{self.property.pk}/disable/"
+        with self.assertNumQueries(4):  # Savepoint, 2 updates, release
+            response = self.client.post(path)
+        self.assertEqual(response.data["data"], {"properties": 1, "activities": 3})
+        self.property.refresh_from_db()
+        self.assertEqual(self.property.status, "Inactive")
+        self.assertIsNotNone(self.property.disabled_at)
+        self.assertEqual(
+            list(
+                Activity.objects.exclude(status="cancelled")
+                .order_by("property_id", "schedule")
+                .values_list("property_id", flat=True)
+            ),
+            [self.property.pk] + [self.other.pk] * 4,  # The past activity stays
+        )
+        self.assertEqual(
+            self.client.post("/api/properties/0/disable/").status_code, 400
+        )
+
+
+class ArchiveTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = Property.objects.create(
+            title="Archive", address="Somewhere", description="-", status="Active"
+        )
+        rows = (
+            (-200, "cancelled", "Pending"),
+            (-150, "Done", "Done"),
+            (-120, "Active", "Overdue"),  # Kept: not finished
+            (-10, "cancelled", "Pending"),  # Kept: inside the retention window
+            (2, "Active", "Pending"),
+        )
+        self.activities = [
+            Activity.objects.create(
+                property=self.property,
+                title=f"activity {days}",
+                schedule=now() + timedelta(days=days),
+                status=status,
+                condition=condition,
+            )
+            for days, status, condition in rows
+        ]
+        for activity in self.activities[1:3]:
+            Survey.objects.create(activity=activity, answers={"rating": 5})
+        self.client = APIClient()
+
+    def archive(self):
+        call_command("archive_activities", batch_size=1, stdout=StringIO())
+
+    def ids(self, query):
+        response = self.client.get(f"/api/activities/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.data["data"]]
+
+    def test_archive(self):
+        ic("Old finished activities move to the archive with their surveys")
+        rebuild_answer_counts()
+        counts = list(SurveyAnswerCount.objects.values_list("answer", "count"))
+        self.archive()
+        archived = [activity.pk for activity in self.activities[:2]]
+        self.assertEqual(
+            sorted(ArchivedActivity.objects.values_list("pk", flat=True)), archived
+        )
+        self.assertFalse(Activity.objects.filter(pk__in=archived).exists())
+        survey = ArchivedSurvey.objects.get()
+        self.assertEqual(
+            (survey.activity_id, survey.answers), (archived[1], {"rating": 5})
+        )
+        self.assertEqual(Survey.objects.count(), 1)
+        ic("Archived surveys stay in the answer counts")
+        rebuild_answer_counts()
+        self.assertEqual(
+            list(SurveyAnswerCount.objects.values_list("answer", "count")), counts
+        )
+        self.archive()  # Nothing left to move
+        self.assertEqual(ArchivedActivity.objects.count(), 2)
+
+    def test_include_archived(self):
+        ic("The archive is read only with ?include_archived=1")
+        query = "status=all&schedule_from=2000-01-01T00:00"
+        every = [activity.pk for activity in self.activities]
+        self.assertEqual(self.ids(query), every)
+        self.client.get(f"/api/activities/?{query}&include_archived=1")  # Cached
+        self.archive()
+        self.assertEqual(self.ids(query), every[2:])
+        self.assertEqual(sorted(self.ids(f"{query}&include_archived=1")), every)
+
+        ic("Pages merge the live and archived rows in key order")
+        pages, cursor = [], ""
+        while True:
+            response = self.client.get(
+                f"/api/activities/?{query}&include_archived=1&page_size=2&count=1{cursor}"
+            )
+            self.assertEqual(response.data["count"], 5)
+            pages += [row["id"] for row in response.data["data"]]
+            if not response.data["next"]:
+                break
+            cursor = f"&cursor={response.data['next']}"
+        self.assertEqual(pages, every)
+
+    def test_archived_detail(self):
+        ic("Archived activities and surveys by id")
+        done = self.activities[1]
+        self.archive()
+        path = f"/api/activities/{done.pk}/"
+        self.assertEqual(self.client.get(path).status_code, 400)
+        response = self.client.get(f"{path}?include_archived=1")
+        self.assertEqual(response.data["data"]["title"], "activity -150")
+        survey = response.data["data"]["survey"]
+        self.assertTrue(survey.endswith(f"{path}survey/?include_archived=1"))
+        response = self.client.get(f"{path}survey/?include_archived=1")
+        self.assertEqual(response.data["data"]["answers"], {"rating": 5})
+        response = self.client.get("/api/surveys/?include_archived=1")
+        self.assertEqual(response.data["count"], 2)
+        response = self.client.get("/api/surveys/")
+        self.assertEqual(response.data["count"], 1)
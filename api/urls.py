@@ -1,6 +1,6 @@
 from django.urls import include, path
 from rest_framework import routers
-from . import views
+from . import async_views, views
 
 router = routers.DefaultRouter()
 router.register(r"properties", views.PropertyViewSet)
@@ -16,4 +16,11 @@ urlpatterns = [
         views.SurveyViewSet.as_view({"get": "retrieve", "post": "create"}),
     ),
     path("surveys/", views.SurveyViewSet.as_view({"get": "list"})),
+    path("surveys/export/", views.SurveyViewSet.as_view({"get": "export"})),
+    # Async read endpoints (served by an ASGI server, e.g. uvicorn)
+    path("async/properties/", async_views.property_list),
+    path("async/properties/<int:pk>/", async_views.property_detail),
+    path("async/activities/", async_views.activity_list),
+    path("async/activities/<int:pk>/", async_views.activity_detail),
+    path("async/activities/<int:pk>/survey/", async_views.survey_detail),
 ]
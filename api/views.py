@@ -1,22 +1,54 @@
 # from django.shortcuts import render
 from django.contrib.auth.models import User, Group
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
 
 # from rest_framework.views import APIView
 # from rest_framework.decorators import api_view
 from .serializers import PropertySerializer, ActivitySerializer, SurveySerializer
-from .models import Property, Activity, Survey
-from .responses import ErrorMsg, StatusMsg, SuccessMsg
+from .serializers import schedule_conflict, sweep_schedules, is_overlap
+from .models import Property, Activity, Survey, SurveyAnswerCount
+from .models import condition_due
+from .models import ArchivedActivity, ArchivedSurvey
+from .aggregates import count_answers
+from .responses import ErrorMsg, StatusMsg, SuccessMsg, InfoMsg
+from .pagination import KeysetPagination
+from .filters import ACTIVITY_FILTERS, filter_activities, filter_surveys
+from .filters import condition_filtered, include_archived, parse_schedule
+from .filters import autocomplete_properties, search_properties
+from .availability import availability
+from .export import FORMATS, format_datetime, stream_export
+from .cache import cached_response, invalidate
+from .conditional import add_validators, combine_validators, list_validators
+from .conditional import due_changes, not_modified
+from .conditional import object_validators, page_validators
+from .middleware import timing
+from .identity import get_object
+from .fieldsets import sparse_fieldset
 
 # from datetime import timedelta
 # from datetime import datetime
-from django.utils.timezone import now
-from django.utils.timezone import datetime
+from django.utils.timezone import get_current_timezone, make_aware, now
 from django.utils.timezone import timedelta
 
 from functools import wraps
+from itertools import chain
+
+ACTIVITY_EXPORT_FIELDS = (
+    "id",
+    "property",
+    "schedule",
+    "title",
+    "created_at",
+    "updated_at",
+    "status",
+    "condition",
+)
+SURVEY_EXPORT_FIELDS = ("id", "activity", "created_at", "answers")
 
 # from icecream import ic
 
@@ -24,6 +56,8 @@ from functools import wraps
 def validate_activity_exists():
     """Decorator for validating that the id received for activity is from a valid one
 
+    GETs with ?include_archived=1 also find archived activities.
+
     Returns:
         Response: Some of these errors:
             ACTIVITY_REQUIRED
@@ -40,9 +74,14 @@ def validate_activity_exists():
                     status=400,
                 )
             context = {"request": kwargs.get("request")}
-            activity = ActivitySerializer(
-                Activity.objects.filter(pk=pk).first(), context=context
-            )
+            queryset = Activity.objects.select_related("survey")
+            instance = get_object(Activity, queryset=queryset, pk=pk)
+            request = args[1]
+            if instance is None and request.method == "GET":
+                if include_archived(request.query_params):
+                    queryset = ArchivedActivity.objects.select_related("survey")
+                    instance = get_object(ArchivedActivity, queryset=queryset, pk=pk)
+            activity = ActivitySerializer(instance, context=context)
             if not activity.instance:
                 return Response(
                     {"status": StatusMsg.ERROR, "error": ErrorMsg.NOT_FOUND}, status=400
@@ -80,23 +119,58 @@ def validate_empty_request():
     return wrapper
 
 
-def custom_retrieve(serializer, request, pk, *args, **kwargs):
-    model = serializer.Meta.model
-    instance = model.objects.filter(pk=pk).first()
-    serializer_context = {
+def export_response(request, queryset, fields, filename, json_field=None):
+    if (output := request.query_params.get("output", "ndjson")) not in FORMATS:
+        return Response(
+            dict(
+                status=StatusMsg.ERROR,
+                error=ErrorMsg.INVALID_VALUE.format("output"),
+                info=InfoMsg.AVAILABLE_VALUES.format(", ".join(FORMATS)),
+            ),
+            status=400,
+        )
+    return stream_export(queryset, fields, output, filename, json_field=json_field)
+
+
+def intervals(pairs):
+    return [
+        {"start": format_datetime(start), "end": format_datetime(end)}
+        for start, end in pairs
+    ]
+
+
+def custom_retrieve(
+    serializer,
+    request,
+    pk,
+    *args,
+    queryset=None,
+    updated_field=None,
+    context=None,
+    due=None,
+    **kwargs,
+):
+    if queryset is None:
+        queryset = serializer.Meta.model.objects.all()
+    serializer_context = context or {
         "request": request,
     }
+    if hasattr(serializer, "only"):  # Sparse fieldset
+        required = (updated_field, *((due[0],) if due else ()))
+        queryset = serializer.only(queryset, serializer_context, required)
+    instance = get_object(queryset.model, queryset=queryset, pk=pk)
     if not instance:
         return Response(
             dict(status=StatusMsg.ERROR, error=ErrorMsg.NOT_FOUND), status=400
         )
-    else:
-        return Response(
-            dict(
-                status=StatusMsg.OK,
-                data=serializer(instance, context=serializer_context).data,
-            )
-        )
+    validators = updated_field and object_validators(instance, updated_field, due)
+    if validators and (response := not_modified(request, *validators)) is not None:
+        return response
+    with timing("serialize"):
+        data = serializer(instance, context=serializer_context).data
+    response = Response(dict(status=StatusMsg.OK, data=data))
+    _, response.valid_until = due_changes([instance], due)
+    return add_validators(response, *validators) if validators else response
 
 
 def custom_create(serializer, request, *args, **kwargs):
@@ -128,12 +202,123 @@ class CustomView(viewsets.ModelViewSet):
     def create(self, request):
         return custom_create(self.serializer_class, request)
 
+    @cached_response()
     def retrieve(self, request, pk):
-        return custom_retrieve(self.serializer_class, request, pk)
+        return custom_retrieve(
+            self.serializer_class,
+            request,
+            pk,
+            queryset=self.listing_queryset(self.get_queryset()),
+            updated_field=self.updated_field,
+            context=self.get_serializer_context(),
+            due=self.due(),
+        )
 
     def update(self, request, pk):
         return Response({"status": StatusMsg.ERROR, "error": ErrorMsg.NOT_ALLOWED})
 
+    def get_serializer_context(self):
+        """Context with the sparse fieldset (?fields=, ?expand=) of the request"""
+        context = super().get_serializer_context()
+        if self.request is not None and hasattr(self.serializer_class, "only"):
+            context.update(
+                sparse_fieldset(self.request.query_params, self.serializer_class)
+            )
+        return context
+
+    def due(self):
+        """Changes of the representation with time (see models.condition_due)"""
+        return None
+
+    def listing_queryset(self, queryset):
+        """Joins/annotations needed to serialize the rows (not to count them)"""
+        return queryset
+
+    def list_rows(self, queryset, keyset=None):
+        """values() rows when the serializer has the fast path, else instances
+
+        Only the columns of the fieldset are read, plus the ones of the
+        pagination key and the validators.
+        """
+        keyset = keyset or self.keyset
+        required = ("id", self.updated_field, *(key.lstrip("-") for key in keyset))
+        if due := self.due():
+            required = (*required, due[0])
+        if hasattr(self.serializer_class, "from_values"):
+            return self.serializer_class.values(
+                queryset, self.get_serializer_context(), required
+            )
+        return queryset
+
+    def list_data(self, rows):
+        if hasattr(self.serializer_class, "from_values"):
+            return self.serializer_class.from_values(
+                rows, self.get_serializer_context()
+            )
+        return self.get_serializer(rows, many=True).data
+
+    def list_response(self, request, queryset, keyset=None, archived=None):
+        """Serialize a filtered queryset, paginated when the client asks for it
+
+        Args:
+            request (Request): Current request
+            queryset (QuerySet): Filtered queryset of the view model
+            keyset (tuple, optional): Ordering of the pages (the view keyset by
+                default)
+            archived (QuerySet, optional): Filtered archived rows, listed too
+
+        Returns:
+            Response: {status, count, data} or {status, [count], data, next},
+                or 304 when the client copy (ETag / Last-Modified) is current.
+                valid_until is the next time the data changes without a write
+        """
+        keyset = keyset or self.keyset
+        due = self.due()
+        paginator = KeysetPagination(request, keyset)
+        querysets = [queryset] if archived is None else [queryset, archived]
+        if not paginator.requested:
+            results = [
+                list_validators(request, queryset, self.updated_field, due)
+                for queryset in querysets
+            ]
+            validators = combine_validators(*(result[0] for result in results))
+            if (response := not_modified(request, *validators)) is not None:
+                return response
+            rows = chain.from_iterable(
+                self.list_rows(self.listing_queryset(queryset), keyset)
+                for queryset in querysets
+            )
+            with timing("serialize"):
+                data = self.list_data(rows)
+            count = sum(result[1] for result in results)
+            response = Response(dict(status=StatusMsg.OK, count=count, data=data))
+            response.valid_until = min(
+                (result[2] for result in results if result[2]), default=None
+            )
+            return add_validators(response, *validators)
+        page = paginator.get_page(
+            paginator.merge(
+                [
+                    paginator.paginate_queryset(
+                        self.list_rows(self.listing_queryset(queryset), keyset)
+                    )
+                    for queryset in querysets
+                ]
+            )
+        )
+        validators = page_validators(request, page, self.updated_field, due)
+        if (response := not_modified(request, *validators)) is not None:
+            return response
+        body = dict(status=StatusMsg.OK)
+        if paginator.with_count:
+            body["count"] = sum(queryset.count() for queryset in querysets)
+        with timing("serialize"):
+            body["data"] = self.list_data(page)
+        body["next"] = paginator.next_cursor
+        response = Response(body)
+        _, response.valid_until = due_changes(page, due)
+        return add_validators(response, *validators)
+
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
@@ -150,82 +335,473 @@ class GroupSerializer(serializers.HyperlinkedModelSerializer):
 class PropertyViewSet(CustomView):
     queryset = Property.objects.all().order_by("created_at")
     serializer_class = PropertySerializer
+    keyset = ("created_at", "id")
+    cache_models = (Property,)
+    updated_field = "updated_at"
 
+    @cached_response()
     def list(self, request):
+        """Properties, filtered by ?status= and searched with ?q= (best match first)"""
         status = request.query_params.get("status")
         queryset = Property.objects.all().order_by("created_at")
         if status:
             queryset = queryset.filter(status=status)
-        serializer = self.get_serializer(queryset, many=True)
+        if text := request.query_params.get("q", "").strip():
+            queryset = search_properties(queryset, text).order_by("-rank", "id")
+            return self.list_response(request, queryset, keyset=("-rank", "id"))
+        return self.list_response(request, queryset)
+
+    @action(detail=False)
+    @cached_response(timeout_setting="API_AUTOCOMPLETE_CACHE_TIMEOUT")
+    def autocomplete(self, request):
+        """Address type-ahead: id, title and address of the matching properties
+
+        Query params:
+            prefix (str): Text typed, API_AUTOCOMPLETE_MIN_LENGTH characters or
+                more (shorter texts match nothing)
+            limit (int): Results, API_AUTOCOMPLETE_LIMIT at most (and by default)
+
+        Returns:
+            Response: {status, count, data} with addresses starting with the
+                text first
+        """
+        max_limit = getattr(settings, "API_AUTOCOMPLETE_LIMIT", 10)
+        limit = request.query_params.get("limit", str(max_limit))
+        if not limit.isdigit() or not 0 < int(limit) <= max_limit:
+            return Response(
+                dict(
+                    status=StatusMsg.ERROR,
+                    error=ErrorMsg.INVALID_VALUE.format("limit"),
+                    max=max_limit,
+                ),
+                status=400,
+            )
+        text = request.query_params.get("prefix", "").strip()
+        data = []
+        if len(text) >= getattr(settings, "API_AUTOCOMPLETE_MIN_LENGTH", 3):
+            data = autocomplete_properties(Property.objects.all(), text, int(limit))
+        return Response(dict(status=StatusMsg.OK, count=len(data), data=data))
+
+    @action(detail=True, methods=["post"])
+    def disable(self, request, pk=None):
+        """Set the property Inactive and cancel its future activities
+
+        One UPDATE per table in a single transaction.
+
+        Returns:
+            Response: {status, msg, data: {properties, activities}} with the
+                number of rows changed
+        """
+        queryset = Property.objects.filter(pk=pk if str(pk).isdigit() else None)
+        with transaction.atomic():
+            properties, activities = queryset.disable()
+            invalidate(Property, Activity)  # update() sends no post_save
+        if not properties:
+            return Response(
+                dict(status=StatusMsg.ERROR, error=ErrorMsg.NOT_FOUND), status=400
+            )
         return Response(
-            dict(status=StatusMsg.OK, count=queryset.count(), data=serializer.data)
+            dict(
+                status=StatusMsg.OK,
+                msg=SuccessMsg.DISABLED,
+                data=dict(properties=properties, activities=activities),
+            )
+        )
+
+    @action(detail=True)
+    def availability(self, request, pk=None):
+        """Busy intervals and free schedules of the property
+
+        Query params:
+            from, to (%Y-%m-%dT%H:%M): Range, from now to one week later by default
+            duration (int): Minutes of the activity to place (60 by default)
+
+        Returns:
+            Response: {"property", "from", "to", "duration", "busy": [{start, end}],
+                "free": [{start, end}]} where any schedule of a free range
+                (bounds included) can be created without conflicts. Properties
+                that are not Active take no activities (PROPERTY_INACTIVE)
+        """
+        params = request.query_params
+        property_ = (
+            Property.objects.filter(pk=pk).first() if str(pk).isdigit() else None
+        )
+        if not property_:
+            return Response(
+                dict(status=StatusMsg.ERROR, error=ErrorMsg.NOT_FOUND), status=400
+            )
+        if property_.status != "Active":
+            return Response(
+                dict(status=StatusMsg.ERROR, error=ErrorMsg.PROPERTY_INACTIVE),
+                status=400,
+            )
+        tz = get_current_timezone()
+        start = now().replace(second=0, microsecond=0)
+        if value := params.get("from"):
+            start = make_aware(parse_schedule(value), tz)
+        end = start + timedelta(days=7)
+        if value := params.get("to"):
+            end = make_aware(parse_schedule(value), tz)
+        duration = params.get("duration", "60")
+        max_days = getattr(settings, "API_AVAILABILITY_MAX_DAYS", 31)
+        errors = []
+        if not duration.isdigit() or not 0 < int(duration) <= 24 * 60:
+            errors.append("duration")
+        if not start <= end <= start + timedelta(days=max_days):
+            errors.append("to")
+        if errors:
+            return Response(
+                dict(
+                    status=StatusMsg.ERROR,
+                    error=ErrorMsg.INVALID_VALUE.format(", ".join(errors)),
+                    max_days=max_days,
+                ),
+                status=400,
+            )
+        duration = timedelta(minutes=int(duration))
+        busy, free = availability(property_.pk, start, end, duration)
+        return Response(
+            dict(
+                status=StatusMsg.OK,
+                data={
+                    "property": property_.pk,
+                    "from": format_datetime(start),
+                    "to": format_datetime(end),
+                    "duration": int(duration.total_seconds() // 60),
+                    "busy": intervals(busy),
+                    "free": intervals(free),
+                },
+            )
+        )
+
+    @action(detail=True, url_path="survey-stats")
+    def survey_stats(self, request, pk=None):
+        """Answer distribution of the property surveys, per question
+
+        Read from the SurveyAnswerCount rows of the property (O(answers)).
+
+        Returns:
+            Response: {"property": id, "questions": {question: {answer: count}}}
+        """
+        if not str(pk).isdigit():
+            return Response(
+                dict(status=StatusMsg.ERROR, error=ErrorMsg.NOT_FOUND), status=400
+            )
+        questions = {}
+        rows = (
+            SurveyAnswerCount.objects.filter(property_id=pk)
+            .order_by("question", "answer")
+            .values_list("question", "answer", "count")
+        )
+        for question, answer, count in rows:
+            questions.setdefault(question, {})[answer] = count
+        if not questions and not Property.objects.filter(pk=pk).exists():
+            return Response(
+                dict(status=StatusMsg.ERROR, error=ErrorMsg.NOT_FOUND), status=400
+            )
+        return Response(
+            dict(status=StatusMsg.OK, data=dict(property=int(pk), questions=questions))
         )
 
 
 class ActivityViewSet(CustomView):
-    queryset = Activity.objects.all().order_by("created_at")
+    queryset = Activity.objects.order_by("created_at")
     serializer_class = ActivitySerializer
+    keyset = ("schedule", "id")
+    cache_models = (Activity, Property, Survey)  # Nested property and survey url
+    updated_field = "updated_at"  # Also bumped when the survey is added
 
     # def retrieve(self, request, pk):
 
     # build_absolute_uri(obj.survey)
 
+    @cached_response()
     def list(self, request, *args, **kwargs):
-        queryset = Activity.objects.all()
-        if not request.query_params:
-            queryset = queryset.filter(
-                schedule__range=(
-                    now() - timedelta(days=7),
-                    now() + timedelta(days=7),
-                )
-            )
-        if (status := request.query_params.get("status")) and status != "all":
-            queryset = queryset.filter(status=status)
-
-        if (condition := request.query_params.get("condition")) and condition != "all":
-            queryset = queryset.filter(condition=condition)
-        try:
+        params = request.query_params
+        queryset = filter_activities(params, Activity.objects.all())
+        archived = None
+        if include_archived(params):
+            archived = filter_activities(params, ArchivedActivity.objects.all())
+        response = self.list_response(
+            request, queryset, archived=archived
+        )  # super(ActivityViewSet, self).list(self, *args, **kwargs)
+        if condition_filtered(params):
+            response.valid_until = now()  # Pending rows turn Overdue with time
+        return response
 
-            if schedule_from := request.query_params.get("schedule_from"):
-                queryset = queryset.filter(
-                    schedule__gt=datetime.strptime(schedule_from, "%Y-%m-%dT%H:%M")
-                )
+    @cached_response()
+    def retrieve(self, request, pk):
+        """Activity, looked up in the archive too with ?include_archived=1"""
+        queryset = self.listing_queryset(self.get_queryset())
+        if include_archived(request.query_params) and str(pk).isdigit():
+            if get_object(Activity, queryset=queryset, pk=pk) is None:
+                queryset = self.listing_queryset(ArchivedActivity.objects.all())
+        return custom_retrieve(
+            self.serializer_class,
+            request,
+            pk,
+            queryset=queryset,
+            updated_field=self.updated_field,
+            context=self.get_serializer_context(),
+            due=self.due(),
+        )
 
-            if schedule_to := request.query_params.get("schedule_to"):
-                queryset = queryset.filter(
-                    schedule__lt=datetime.strptime(schedule_to, "%Y-%m-%dT%H:%M")
-                )
-        except Exception as e:
-            print(e)
-            raise serializers.ValidationError({"error": "DateTime format error"})
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(
-            dict(status=StatusMsg.OK, count=queryset.count(), data=serializer.data)
-        )  # super(ActivityViewSet, self).list(self, *args, **kwargs)
+    def due(self):
+        """Pending activities read as Overdue after their schedule (computed mode)"""
+        fields = self.get_serializer_context().get("fields")
+        return condition_due() if fields is None or "condition" in fields else None
+
+    def listing_queryset(self, queryset):
+        return queryset.for_listing(self.get_serializer_context().get("fields"))
+
+    @action(detail=False)
+    def export(self, request):
+        """Stream the filtered activities (?output=ndjson|csv)"""
+        return export_response(
+            request,
+            filter_activities(request.query_params, Activity.objects.order_by("id")),
+            ACTIVITY_EXPORT_FIELDS,
+            "activities",
+        )
 
     @validate_empty_request()
     def create(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            return self.bulk_create(request)
         serializer_context = {
             "request": request,
         }
-        data = request.data.dict()
-        data["property"] = Property.objects.filter(pk=data.get("property")).first()
-        instance = ActivitySerializer(data=data, context=serializer_context)
-        if instance.is_valid():
-            instance.save()
+        data = request.data.dict() if hasattr(request.data, "dict") else request.data
+        with transaction.atomic():  # The overlap check and the insert go together
+            data["property"] = (
+                Property.objects.filter(pk=data.get("property")).lock_schedule().first()
+            )
+            instance = ActivitySerializer(data=data, context=serializer_context)
+            if instance.is_valid():
+                try:
+                    instance.save()
+                except serializers.ValidationError as e:  # Overlap (constraint)
+                    return Response(
+                        dict(
+                            status=StatusMsg.ERROR,
+                            error=ErrorMsg.VALIDATION,
+                            log=e.detail,
+                        ),
+                        status=400,
+                    )
+                return Response(
+                    dict(
+                        status=StatusMsg.OK, msg=SuccessMsg.CREATED, data=instance.data
+                    ),
+                    status=201,
+                )
+        return Response(
+            dict(
+                status=StatusMsg.ERROR,
+                error=ErrorMsg.VALIDATION,
+                log=instance.errors,
+            ),
+            status=400,
+        )
+
+    def bulk_create(self, request):
+        """Create a list of activities with batched lookups and overlap checks
+
+        Properties are resolved (and locked) with one query, existing schedules
+        are read with one range query per property, the items are checked
+        against them and against each other with a sort-and-sweep, and the valid
+        ones are inserted with bulk_create.
+
+        Returns:
+            Response: {status, msg, count, data} where data has the result of
+                each item, in the received order ({status, error, count, data}
+                with a 400 when none was created)
+        """
+        items = request.data
+        if len(items) > (limit := getattr(settings, "API_BULK_MAX", 500)):
             return Response(
-                dict(status=StatusMsg.OK, msg=SuccessMsg.CREATED, data=instance.data),
-                status=201,
+                dict(
+                    status=StatusMsg.ERROR,
+                    error=ErrorMsg.INVALID_VALUE.format("size"),
+                    max=limit,
+                ),
+                status=400,
             )
-        else:
+        context = {"request": request, "bulk": True}
+        results = [None] * len(items)
+        with transaction.atomic():
+            property_ids = set()
+            for item in items:
+                if isinstance(item, dict) and str(item.get("property")).isdigit():
+                    property_ids.add(int(item["property"]))
+            properties = (
+                Property.objects.filter(pk__in=property_ids).lock_schedule().in_bulk()
+            )
+
+            by_property = {}
+            for index, item in enumerate(items):
+                if not isinstance(item, dict):
+                    results[index] = dict(
+                        status=StatusMsg.ERROR,
+                        error=ErrorMsg.VALIDATION,
+                        log={"error": "Expected an object"},
+                    )
+                    continue
+                data = dict(item)
+                property_id = str(data.get("property"))
+                data["property"] = properties.get(
+                    int(property_id) if property_id.isdigit() else None
+                )
+                serializer = ActivitySerializer(data=data, context=context)
+                if serializer.is_valid():
+                    by_property.setdefault(data["property"], []).append(
+                        (index, serializer.validated_data)
+                    )
+                else:
+                    results[index] = dict(
+                        status=StatusMsg.ERROR,
+                        error=ErrorMsg.VALIDATION,
+                        log=serializer.errors,
+                    )
+
+            created = []
+            for property_, batch in by_property.items():
+                schedules = [(index, data["schedule"]) for index, data in batch]
+                lowest = min(schedule for _, schedule in schedules)
+                highest = max(schedule for _, schedule in schedules)
+                existing = list(
+                    Activity.objects.exclude(status="cancelled")
+                    .filter(
+                        property=property_,
+                        schedule__range=(
+                            lowest - timedelta(hours=1),
+                            highest + timedelta(hours=1),
+                        ),
+                    )
+                    .order_by("schedule")
+                    .values_list("schedule", flat=True)
+                )
+                conflicts = sweep_schedules(schedules, existing)
+                for index, data in batch:
+                    if index in conflicts:
+                        results[index] = dict(
+                            status=StatusMsg.ERROR,
+                            error=ErrorMsg.VALIDATION,
+                            log=schedule_conflict(conflicts[index]).detail,
+                        )
+                        continue
+                    activity = Activity(
+                        property=property_,
+                        title=data["title"],
+                        schedule=data["schedule"],
+                        condition=data["condition"],
+                    )
+                    activity.has_survey = False
+                    created.append((index, activity))
+
+            activities = [activity for _, activity in created]
+            try:
+                with transaction.atomic():
+                    Activity.objects.bulk_create(activities)
+                    invalidate(Activity)  # bulk_create sends no post_save
+            except IntegrityError as e:
+                if not is_overlap(e):
+                    raise
+                return Response(
+                    dict(
+                        status=StatusMsg.ERROR,
+                        error=ErrorMsg.VALIDATION,
+                        log={"error": "Activities were booked concurrently"},
+                    ),
+                    status=400,
+                )
+            if activities and activities[0].pk is None:
+                # The backend does not return the ids: (property, schedule) is
+                # unique among active activities, so look them up by it.
+                ids = {
+                    (property_id, schedule): pk
+                    for pk, property_id, schedule in Activity.objects.exclude(
+                        status="cancelled"
+                    )
+                    .filter(
+                        property_id__in={a.property_id for a in activities},
+                        schedule__in={a.schedule for a in activities},
+                    )
+                    .values_list("pk", "property_id", "schedule")
+                }
+                for activity in activities:
+                    activity.pk = ids.get((activity.property_id, activity.schedule))
+
+        for index, activity in created:
+            results[index] = dict(
+                status=StatusMsg.OK,
+                data=ActivitySerializer(activity, context=context).data,
+            )
+        if not created:
             return Response(
                 dict(
                     status=StatusMsg.ERROR,
                     error=ErrorMsg.VALIDATION,
-                    log=instance.errors,
+                    count=0,
+                    data=results,
                 ),
                 status=400,
             )
+        return Response(
+            dict(
+                status=StatusMsg.OK,
+                msg=SuccessMsg.CREATED,
+                count=len(created),
+                data=results,
+            ),
+            status=201,
+        )
+
+    @action(detail=False, methods=["post"], url_path="cancel")
+    def bulk_cancel(self, request):
+        """Cancel every activity matching the filters with a single UPDATE
+
+        Body:
+            property (int), status, condition, schedule_from, schedule_to: Same
+                filters as the list (without the weekly window), one at least
+                ("all" does not count)
+
+        Returns:
+            Response: {status, msg, count} with the activities cancelled
+        """
+        data = request.data
+        if not isinstance(data, dict):  # JSON arrays and scalars
+            return Response(
+                dict(
+                    status=StatusMsg.ERROR,
+                    error=ErrorMsg.VALIDATION,
+                    log={"error": "Expected an object"},
+                ),
+                status=400,
+            )
+        filters = [data.get(name) for name in ("property", *ACTIVITY_FILTERS)]
+        if not any(value and value != "all" for value in filters):  # "all" is no filter
+            return Response(
+                dict(status=StatusMsg.ERROR, error=ErrorMsg.FILTER_REQUIRED),
+                status=400,
+            )
+        queryset = filter_activities(data, Activity.objects.all(), default_window=False)
+        if property_ := data.get("property"):
+            if not str(property_).isdigit():
+                return Response(
+                    dict(
+                        status=StatusMsg.ERROR,
+                        error=ErrorMsg.INVALID_VALUE.format("property"),
+                    ),
+                    status=400,
+                )
+            queryset = queryset.filter(property_id=int(property_))
+        with transaction.atomic():
+            count = queryset.cancel()
+            invalidate(Activity)  # update() sends no post_save
+        return Response(
+            dict(status=StatusMsg.OK, msg=SuccessMsg.CANCELLED, count=count)
+        )
 
     @validate_activity_exists()
     def destroy(self, request, pk=None, activity=None):
@@ -236,6 +812,10 @@ class ActivityViewSet(CustomView):
     @validate_activity_exists()
     def partial_update(self, request, pk=None, activity=None):
         try:
+            if fields := sorted(set(request.data) - {"schedule"}):
+                raise serializers.ValidationError(
+                    {field: "Only the schedule can be updated" for field in fields}
+                )
             activity.reschedule(request.data.get("schedule"))
         except serializers.ValidationError as e:
             return Response(
@@ -253,25 +833,53 @@ class SurveyViewSet(CustomView):
     queryset = Survey.objects.all().order_by("created_at")
     serializer_class = SurveySerializer
     lookup_url_kwarg = "id"
+    keyset = ("created_at", "id")
+    cache_models = (Survey, Activity)  # Surveys of cancelled activities are hidden
+    updated_field = "created_at"  # Surveys are never updated
 
+    @cached_response()
     def list(self, request):
-        queryset = Survey.objects.all().order_by("created_at")
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(
-            dict(status=StatusMsg.OK, count=queryset.count(), data=serializer.data)
+        """Surveys filtered by answers, property and activity (see filter_surveys)"""
+        params = request.query_params
+        queryset = filter_surveys(params, Survey.objects.all().order_by("created_at"))
+        archived = None
+        if include_archived(params):
+            archived = filter_surveys(params, ArchivedSurvey.objects.all())
+        response = self.list_response(request, queryset, archived=archived)
+        if condition_filtered(params):
+            response.valid_until = now()  # Pending rows turn Overdue with time
+        return response
+
+    def export(self, request):
+        """Stream the filtered surveys (?output=ndjson|csv), same filters as list
+
+        answers are flattened into "answers.<key>" columns in CSV.
+        """
+        queryset = filter_surveys(request.query_params, Survey.objects.order_by("id"))
+        return export_response(
+            request, queryset, SURVEY_EXPORT_FIELDS, "surveys", json_field="answers"
         )
 
+    @cached_response()
     @validate_activity_exists()
     def retrieve(self, request, pk, *args, **kwargs):
         # from icecream import ic
-        queryset = Survey.objects.filter(activity_id=pk).first()
+        archived = isinstance(kwargs["activity"].instance, ArchivedActivity)
+        model = ArchivedSurvey if archived else Survey
+        queryset = get_object(model, activity_id=pk)  # Loaded with the activity
         if not queryset:
             return Response(
                 dict(status=StatusMsg.ERROR, error=ErrorMsg.NOT_FOUND), status=400
             )
-        else:
-            serializer = self.get_serializer(queryset)
-            return Response(dict(status=StatusMsg.OK, data=serializer.data))
+        validators = object_validators(queryset, self.updated_field)
+        if (response := not_modified(request, *validators)) is not None:
+            return response
+        serializer = self.get_serializer(queryset)
+        with timing("serialize"):
+            data = serializer.data
+        return add_validators(
+            Response(dict(status=StatusMsg.OK, data=data)), *validators
+        )
 
     @validate_empty_request()
     @validate_activity_exists()
@@ -282,7 +890,11 @@ class SurveyViewSet(CustomView):
         context = {"request": request}
         survey = SurveySerializer(data=data, context=context)
         if survey.is_valid():
-            survey.save()
+            with transaction.atomic():
+                survey.save()
+                count_answers(activity.instance.property_id, survey.instance.answers)
+                activity.instance.updated_at = now()  # Its survey url changed
+                activity.instance.save(update_fields=["updated_at"])
             return Response(
                 {"status": StatusMsg.OK, "msg": SuccessMsg.CREATED, "data": survey.data}
             )
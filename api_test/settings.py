@@ -43,6 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.TimingMiddleware",
+    "api.dbrouters.ReplicaPinMiddleware",
+    "api.identity.IdentityMapMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -85,14 +88,82 @@ WSGI_APPLICATION = "api_test.wsgi.application"
 
 DATABASES = json.loads(Path(Path.cwd() / "db.json").read_text())
 
+# Read replicas: the aliases of db.json declared as {"TEST": {"MIRROR": "default"}}
+# GET requests read from them, see api/dbrouters.py
+API_REPLICAS = [
+    alias
+    for alias, database in DATABASES.items()
+    if database.get("TEST", {}).get("MIRROR") == "default"
+]
+DATABASE_ROUTERS = ["api.dbrouters.ReplicaRouter"]
+# Seconds the reads of a client stay on the primary after it wrote
+API_PIN_SECONDS = 10
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Versioned cache of the list/retrieve responses, see api/cache.py
+API_CACHE_ENABLED = True
+API_CACHE_ALIAS = "default"
+API_CACHE_TIMEOUT = 300
+
+# "stored": Activity.condition as saved (kept current by `manage.py mark_overdue`)
+# "computed": Pending activities past their schedule are listed/filtered as
+# Overdue by a CASE expression in the query
+API_CONDITION_MODE = "stored"
+
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
     # or allow read-only access for unauthenticated users.
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly"
-    ]
+    ],
+    # orjson when installed, stdlib json otherwise (same output)
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
+# Keyset pagination (?page_size=&cursor=) used by the list endpoints
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Max items per bulk POST /api/activities/
+API_BULK_MAX = 500
+
+# Longest range of GET /api/properties/<id>/availability/
+API_AVAILABILITY_MAX_DAYS = 31
+
+# GET /api/properties/autocomplete/: max results, shortest text searched (the
+# trigram indexes need 3 characters) and seconds responses are cached
+API_AUTOCOMPLETE_LIMIT = 10
+API_AUTOCOMPLETE_MIN_LENGTH = 3
+API_AUTOCOMPLETE_CACHE_TIMEOUT = 30
+
+# Cancelled and done activities scheduled more than these days ago are moved
+# to the archive tables by the archive_activities command
+API_ARCHIVE_RETENTION_DAYS = 90
+
+# Rows fetched per round trip by the streaming exports
+API_EXPORT_CHUNK_SIZE = 2000
+# Server-Timing header on every response; API_TIMING_LOG also logs each
+# request as one structured line ("api.timing" logger)
+API_TIMING_ENABLED = True
+API_TIMING_LOG = False
+
+# Threads of the async read views (/api/async/...): bounds the queries in
+# flight and the open connections per ASGI worker
+API_ASYNC_WORKERS = 8
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 